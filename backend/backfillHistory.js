@@ -0,0 +1,61 @@
+import mongoose from 'mongoose';
+import axios from 'axios';
+import dotenv from 'dotenv';
+import User from './models/Usermodel.js';
+
+dotenv.config();
+
+// One-off: copy the search history kept on user records into the
+// recommendation server's history store, then retrain from it.
+// The counts are sent as totals and the server only appends what it is
+// missing, so visits ingested since /api/places started posting them are
+// not counted twice and the script can be run again safely.
+const ML_URL = process.env.ML_URL || 'http://localhost:5000';
+const BATCH_USERS = 200;
+
+const postBatch = async (entries) => {
+  if (entries.length === 0) {
+    return 0;
+  }
+  const response = await axios.post(`${ML_URL}/ingest_history`, {
+    history: entries,
+    backfill: true,
+    update_model: false,
+  });
+  return response.data.ingested;
+};
+
+const backfillHistory = async () => {
+  try {
+    await mongoose.connect(process.env.MONGO_URI);
+
+    let entries = [];
+    let users = 0;
+    let ingested = 0;
+    const cursor = User.find({ 'history.0': { $exists: true } }, { history: 1 }).cursor();
+    for await (const user of cursor) {
+      for (const { tag, count } of user.history) {
+        entries.push({ user: user._id.toString(), tag, count });
+      }
+      users += 1;
+      if (users % BATCH_USERS === 0) {
+        ingested += await postBatch(entries);
+        entries = [];
+      }
+    }
+    ingested += await postBatch(entries);
+    console.log(`Backfilled ${ingested} history entries from ${users} users`);
+
+    if (ingested > 0) {
+      const response = await axios.post(`${ML_URL}/retrain_model`, {});
+      console.log('Retrain started:', response.data.status_url);
+    }
+  } catch (error) {
+    console.error('Error backfilling history:', error.message);
+    process.exitCode = 1;
+  } finally {
+    await mongoose.disconnect();
+  }
+};
+
+backfillHistory();
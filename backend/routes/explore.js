@@ -30,13 +30,10 @@ router.get('/nearby/:location', verifyToken, async (req, res) => {
         return res.status(404).json({ error: 'User not found' });
       }
   
-      // Extract user history
-      const userHistory = user.history;
-  
-      // Step 1: Send user history to the recommendation server
+      // Step 1: Ask the recommendation server, which keeps the user history
+      // ingested by /api/places searches
       const recommendationResponse = await axios.post("http://localhost:5000/recommend_tags", {
         user_id: req.userId,
-        history: userHistory,
         top_n: 6, // Request 6 recommendations
       });
   
@@ -475,6 +475,16 @@ const keywordToType = {
               }
             }
             await user.save();
+
+            // Feed the visits to the recommendation server's history store
+            axios.post("http://localhost:5000/ingest_history", {
+              history: interests.map(interest => ({
+                user: req.userId,
+                tag: interest,
+                count: 1,
+                timestamp: new Date().toISOString(),
+              })),
+            }).catch(err => console.error('Failed to ingest history:', err.message));
           }
         }
       }
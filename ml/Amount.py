@@ -9,6 +9,36 @@ from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
 from sklearn.base import BaseEstimator, TransformerMixin
+from model_registry import get_registry
+from template_matcher import ExtractionCascade, TEMPLATE_CONFIDENCE
+from metrics import time_stage
+from inference import encode_senders
+
+EXTRACTION_MODELS_PATH = 'upi_extraction_models.pkl'
+
+# Patterns used by the helpers below, compiled once at import. The trained
+# encoders were fitted on these exact outputs, so they stay as they are;
+# extraction_engine holds the single-pass extractor for everything else.
+_NON_LETTERS = re.compile(r'[^a-zA-Z\s]')
+_WHITESPACE = re.compile(r'\s+')
+_BANK_PATTERN = re.compile(r'-([\w\s]+)$')
+_ACCOUNT_PATTERN = re.compile(r'A/C\s*([X\d]+)')
+_RECIPIENT_PATTERNS = [
+    # Pattern for "trf to" or "transfer to" followed by a name
+    re.compile(r'(?:trf\s+to|transfer\s+to|payment\s+to)\s*([A-Za-z\s]+)(?=\s*Refno|\s*Ref|\s*Call|-)', re.IGNORECASE),
+    
+    # Pattern for names after "to" with potential multi-word names
+    re.compile(r'to\s*([A-Za-z\s]+)(?=\s*Refno|\s*Ref|\s*Call|-)', re.IGNORECASE),
+    
+    # VPA extraction as a fallback
+    re.compile(r'VPA\s*([a-zA-Z0-9@.]+)', re.IGNORECASE)
+]
+_RECIPIENT_SUFFIX = re.compile(r'\s*(?:Refno|Ref).*$', re.IGNORECASE)
+_AMOUNT_PATTERNS = [
+    re.compile(r'by\s*(\d+(?:\.\d{1,2})?)'),  # Matches "by 50.0" or "by 5000"
+    re.compile(r'\₹\s?(\d{1,3}(?:,\d{3})*(?:\.\d{1,2})?)'),  # Indian Rupee ₹
+    re.compile(r'INR\s?(\d{1,3}(?:,\d{3})*(?:\.\d{1,2})?)'),  # INR format
+]
 
 class MessageFeatureExtractor(BaseEstimator, TransformerMixin):
     def __init__(self):
@@ -31,19 +61,23 @@ class MessageFeatureExtractor(BaseEstimator, TransformerMixin):
         if not isinstance(X, (pd.Series, list)):
             X = pd.Series(X)
         
-        # Feature extraction
+        # Feature extraction. The trained pipelines were fitted on exactly
+        # these patterns, so they must not follow extraction_engine's
+        # broader ones.
         features = []
         for message in X:
+            message = str(message)
+            
             # Extract amount
-            amount_match = re.search(r'by\s*(\d+(?:\.\d{1,2})?)', str(message))
+            amount_match = _AMOUNT_PATTERNS[0].search(message)
             amount = float(amount_match.group(1)) if amount_match else 0
             
             # Extract bank/sender
-            bank_match = re.search(r'-([\w\s]+)$', str(message))
+            bank_match = _BANK_PATTERN.search(message)
             sender = bank_match.group(1).strip() if bank_match else 'Unknown'
             
             # Extract account number
-            account_match = re.search(r'A/C\s*([X\d]+)', str(message))
+            account_match = _ACCOUNT_PATTERN.search(message)
             account = account_match.group(1) if account_match else 'Unknown'
             
             features.append([amount, sender, account])
@@ -51,7 +85,15 @@ class MessageFeatureExtractor(BaseEstimator, TransformerMixin):
         return np.array(features)
 
 class UPIMessageExtractor:
-    def __init__(self):
+    def __init__(self, models_path=EXTRACTION_MODELS_PATH, fast_path=True,
+                 min_confidence=TEMPLATE_CONFIDENCE):
+        # Shared, load-once registry for the trained extraction bundle
+        self.models_path = models_path
+        self.registry = get_registry(models_path)
+        
+        # Rule-first cascade: confident template matches skip the models
+        self.cascade = ExtractionCascade(enabled=fast_path, min_confidence=min_confidence)
+        
         # Initialize encoders
         self.bank_encoder = LabelEncoder()
         self.account_encoder = LabelEncoder()
@@ -79,13 +121,13 @@ class UPIMessageExtractor:
     def preprocess_text(self, text):
         """Clean text for better vectorization"""
         text = str(text).lower()
-        text = re.sub(r'[^a-zA-Z\s]', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _NON_LETTERS.sub('', text)
+        text = _WHITESPACE.sub(' ', text).strip()
         return text
     
     def extract_bank(self, message):
         """Extract bank from the message"""
-        bank_match = re.search(r'-([\w\s]+)$', str(message))
+        bank_match = _BANK_PATTERN.search(str(message))
         return bank_match.group(1).strip() if bank_match else 'Unknown'
     
     def _extract_recipient(self, message):
@@ -98,27 +140,15 @@ class UPIMessageExtractor:
         Returns:
             str: Extracted recipient name
         """
-        # Comprehensive recipient extraction patterns
-        recipient_patterns = [
-            # Pattern for "trf to" or "transfer to" followed by a name
-            r'(?:trf\s+to|transfer\s+to|payment\s+to)\s*([A-Za-z\s]+)(?=\s*Refno|\s*Ref|\s*Call|-)',
-            
-            # Pattern for names after "to" with potential multi-word names
-            r'to\s*([A-Za-z\s]+)(?=\s*Refno|\s*Ref|\s*Call|-)',
-            
-            # VPA extraction as a fallback
-            r'VPA\s*([a-zA-Z0-9@.]+)'
-        ]
-        
         # Try each pattern
-        for pattern in recipient_patterns:
-            recipient_match = re.search(pattern, str(message), re.IGNORECASE)
+        for pattern in _RECIPIENT_PATTERNS:
+            recipient_match = pattern.search(str(message))
             if recipient_match:
                 # Clean and return the recipient name
                 recipient = recipient_match.group(1).strip()
                 
                 # Remove any trailing punctuation or reference numbers
-                recipient = re.sub(r'\s*(?:Refno|Ref).*$', '', recipient, flags=re.IGNORECASE)
+                recipient = _RECIPIENT_SUFFIX.sub('', recipient)
                 
                 # Ensure the recipient is not too short or just a single letter
                 if len(recipient) > 1:
@@ -129,14 +159,8 @@ class UPIMessageExtractor:
     
     def _extract_amount(self, message):
         """Extract amount from message"""
-        amount_patterns = [
-            r'by\s*(\d+(?:\.\d{1,2})?)',  # Matches "by 50.0" or "by 5000"
-            r'\₹\s?(\d{1,3}(?:,\d{3})*(?:\.\d{1,2})?)',  # Indian Rupee ₹
-            r'INR\s?(\d{1,3}(?:,\d{3})*(?:\.\d{1,2})?)',  # INR format
-        ]
-        
-        for pattern in amount_patterns:
-            match = re.search(pattern, str(message))
+        for pattern in _AMOUNT_PATTERNS:
+            match = pattern.search(str(message))
             if match:
                 # Remove commas and convert to float
                 amount_str = match.group(1).replace(',', '')
@@ -149,7 +173,7 @@ class UPIMessageExtractor:
     
     def _extract_account(self, message):
         """Extract account number from message"""
-        account_match = re.search(r'A/C\s*([X\d]+)', str(message))
+        account_match = _ACCOUNT_PATTERN.search(str(message))
         return account_match.group(1) if account_match else 'Unknown'
     
     def prepare_dataset(self, messages=None, dataset_path=None):
@@ -305,10 +329,13 @@ class UPIMessageExtractor:
             'bank_encoder': self.bank_encoder,
             'account_encoder': self.account_encoder,
             'recipient_encoder': self.recipient_encoder
-        }, 'upi_extraction_models.pkl')
+        }, self.models_path)
         
         print("Models and encoders saved successfully!")
         
+        # Publish the freshly trained bundle to everyone sharing the registry
+        self.registry.reload(force=True)
+        
         return bank_pipeline, account_pipeline, recipient_pipeline, amount_pipeline
     
     def predict_details(self, message):
@@ -321,61 +348,122 @@ class UPIMessageExtractor:
         Returns:
             dict: Predicted bank, account, recipient, and amount
         """
+        return self.predict_details_batch([message])[0]
+    
+    @staticmethod
+    def _predict_shared_features(models, input_data, model_keys):
+        """
+        Run several pipelines while transforming the input only once per
+        distinct preprocessor.
+        
+        The extraction pipelines are trained around the same ColumnTransformer
+        object, so the TF-IDF features are computed once and fed to every
+        final estimator instead of once per pipeline.
+        
+        Args:
+            models (dict): Loaded extraction bundle
+            input_data (pd.DataFrame): Raw pipeline input
+            model_keys (list): Bundle keys of the pipelines to run
+        
+        Returns:
+            dict: Predictions per model key
+        """
+        feature_cache = {}
+        predictions = {}
+        for key in model_keys:
+            steps = models[key].steps
+            transformers = [step for _, step in steps[:-1]]
+            cache_key = tuple(id(step) for step in transformers)
+            if cache_key not in feature_cache:
+                with time_stage('tfidf_transform'):
+                    features = input_data
+                    for transformer in transformers:
+                        features = transformer.transform(features)
+                feature_cache[cache_key] = features
+            with time_stage(f'predict_{key}'):
+                predictions[key] = steps[-1][1].predict(feature_cache[cache_key])
+        return predictions
+    
+    def predict_details_batch(self, messages):
+        """
+        Predict details for a batch of UPI messages
+        
+        Messages that match a known bank template are answered by the rule
+        based fast path (with a 'confidence' score); the rest go through the
+        extraction models.
+        
+        Args:
+            messages (list): Input messages
+        
+        Returns:
+            list: Predicted bank, account, recipient, and amount per message
+        """
+        results = [self.cascade.try_fast_path(message) for message in messages]
+        fallback_indices = [i for i, result in enumerate(results) if result is None]
+        if fallback_indices:
+            model_results = self._predict_with_models([messages[i] for i in fallback_indices])
+            for i, result in zip(fallback_indices, model_results):
+                results[i] = result
+        return results
+    
+    def get_cascade_stats(self):
+        """Return fast path vs model fallback hit rates"""
+        return self.cascade.get_stats()
+    
+    def _predict_with_models(self, messages):
+        """
+        Predict details for a batch of messages with the extraction models
+        
+        Args:
+            messages (list): Input messages
+        
+        Returns:
+            list: Predicted bank, account, recipient, and amount per message
+        """
+        # Extract bank, account, recipient and amount with the regex helpers
+        banks = [self.extract_bank(message) for message in messages]
+        recipients = [self._extract_recipient(message) for message in messages]
+        accounts = [self._extract_account(message) for message in messages]
+        amounts = [self._extract_amount(message) for message in messages]
+        
+        if not messages:
+            return []
+        
         try:
-            # Load saved models
-            models_path = 'upi_extraction_models.pkl'
-            models = joblib.load(models_path)
-            
-            # Extract bank, account, and recipient
-            bank = self.extract_bank(message)
-            recipient = self._extract_recipient(message)
-            account = self._extract_account(message)
-            amount = self._extract_amount(message)
-            
-            # Preprocess message
-            processed_msg = self.preprocess_text(message)
+            # Saved models are loaded once per process by the registry
+            models = self.registry.get()
             
             # Handle unseen banks, accounts, and recipients by using a default encoding
-            try:
-                bank_encoded = models['bank_encoder'].transform([bank])[0]
-            except ValueError:
-                bank_encoded = -1  # Default value for unseen bank
-            
-            try:
-                account_encoded = models['account_encoder'].transform([account])[0]
-            except ValueError:
-                account_encoded = -1  # Default value for unseen account
-            
-            try:
-                recipient_encoded = models['recipient_encoder'].transform([recipient])[0]
-            except ValueError:
-                recipient_encoded = -1  # Default value for unseen recipient
-            
-            # Prepare input data
+            with time_stage('preprocess_text'):
+                processed = [self.preprocess_text(message) for message in messages]
             input_data = pd.DataFrame({
-                'processed_message': [processed_msg],
-                'bank_encoded': [bank_encoded],
-                'account_encoded': [account_encoded],
-                'recipient_encoded': [recipient_encoded]
+                'processed_message': processed,
+                'bank_encoded': encode_senders(models['bank_encoder'], banks),
+                'account_encoded': encode_senders(models['account_encoder'], accounts),
+                'recipient_encoded': encode_senders(models['recipient_encoder'], recipients)
             })
             
-            # Predict bank, account, recipient, and amount
-            bank_pred = models['bank_model'].predict(input_data)[0]
-            account_pred = models['account_model'].predict(input_data)[0]
-            recipient_pred = models['recipient_model'].predict(input_data)[0]
-            amount_pred = models['amount_model'].predict(input_data)[0]
+            # Predict bank, account, recipient, and amount on a shared feature matrix
+            predictions = self._predict_shared_features(
+                models, input_data,
+                ['bank_model', 'account_model', 'recipient_model', 'amount_model']
+            )
             
             # Decode predictions
-            decoded_bank = models['bank_encoder'].inverse_transform([bank_pred])[0]
-            decoded_account = models['account_encoder'].inverse_transform([account_pred])[0]
-            decoded_recipient = models['recipient_encoder'].inverse_transform([recipient_pred])[0]
+            decoded_banks = models['bank_encoder'].inverse_transform(predictions['bank_model'])
+            decoded_accounts = models['account_encoder'].inverse_transform(predictions['account_model'])
+            decoded_recipients = models['recipient_encoder'].inverse_transform(predictions['recipient_model'])
             
-            return {
-                'bank': decoded_bank,
-                'account': decoded_account,
-                'recipient': decoded_recipient if decoded_recipient != 'Unknown' else recipient,
-                'amount': round(amount_pred if amount_pred > 0 else amount, 2)
-            }
+            results = []
+            for i in range(len(messages)):
+                amount_pred = predictions['amount_model'][i]
+                results.append({
+                    'bank': decoded_banks[i],
+                    'account': decoded_accounts[i],
+                    'recipient': decoded_recipients[i] if decoded_recipients[i] != 'Unknown' else recipients[i],
+                    'amount': round(amount_pred if amount_pred > 0 else amounts[i], 2)
+                })
+            return results
         except FileNotFoundError:
             # Train models if not found
             self.train_extraction_models(messages=[
@@ -384,16 +472,16 @@ class UPIMessageExtractor:
                 "Transaction Alert: A/C X9876 debited ₹350.50 on 20Jan25 trf to Sarah Johnson. Ref No: 456123. -Axis"
             ])
             # Retry prediction
-            return self.predict_details(message)
+            return self._predict_with_models(messages)
         except Exception as e:
             # Handle any other unexpected errors
-            return {
+            return [{
                 'error': str(e),
                 'bank': bank,
                 'account': account,
                 'recipient': recipient,
                 'amount': amount
-            }
+            } for bank, account, recipient, amount in zip(banks, accounts, recipients, amounts)]
 
 # Example usage
 if __name__ == "__main__":
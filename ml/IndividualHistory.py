@@ -1,12 +1,13 @@
 import numpy as np
 import pandas as pd
-from collections import defaultdict
+from scipy import sparse
 import pickle
 import random
 import time
 import os
 import threading
 import logging
+from collections import Counter, namedtuple
 from datetime import datetime
 
 # Set up logging
@@ -14,6 +15,25 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('tag_recommender')
 
+class TagModelSnapshot(namedtuple('TagModelSnapshot', [
+        'version', 'cooccurrence_counts', 'cooccurrence_matrix', 'tag_counts', 'popularity', 'total_visits',
+        'last_updated'])):
+    """
+    One published version of a TagRecommendationModel's learned state.
+    
+    Snapshots are never modified once published: the arrays are read-only
+    and fit and update build a new snapshot instead. A reader that takes
+    the model's current snapshot once sees a consistent version however
+    many updates are published meanwhile.
+    """
+    __slots__ = ()
+
+
+def _freeze(array):
+    array.setflags(write=False)
+    return array
+
+
 class TagRecommendationModel:
     def __init__(self, all_possible_tags):
         """
@@ -26,23 +46,77 @@ class TagRecommendationModel:
         self.tag_list = sorted(list(all_possible_tags))
         self.tag_to_idx = {tag: idx for idx, tag in enumerate(self.tag_list)}
         
-        # Tag co-occurrence matrix
-        self.cooccurrence_matrix = np.zeros((len(self.tag_list), len(self.tag_list)))
-        
-        # Tag popularity counts
-        self.tag_counts = {tag: 0 for tag in self.tag_list}
-        
-        # Total visits processed
-        self.total_visits = 0
-        
         # Cache for quick lookup
         self.similarity_cache = {}
         
-        # Track when the model was last updated
-        self.last_updated = datetime.now()
+        # Serializes fit and update; readers never take it
+        self._write_lock = threading.Lock()
+        
+        # Visit counts per user, kept so an update can pair a user's new
+        # visits with their earlier ones. Only fit and update use them.
+        self.user_to_idx = {}
+        self.user_counts = sparse.csr_matrix((0, len(self.tag_list)), dtype=np.int64)
+        
+        # Raw tag co-occurrence counts and tag popularity counts are the
+        # source of truth; the normalized matrix is derived from them
+        size = len(self.tag_list)
+        self._snapshot = self._build_snapshot(
+            version=1,
+            counts=np.zeros((size, size), dtype=np.int64),
+            tag_counts={tag: 0 for tag in self.tag_list},
+            total_visits=0,
+            normalized=np.zeros((size, size))
+        )
+    
+    @property
+    def snapshot(self):
+        """The current TagModelSnapshot; read it once to pin a version"""
+        return self._snapshot
+    
+    # The learned state is read from the current snapshot
+    cooccurrence_counts = property(lambda self: self._snapshot.cooccurrence_counts)
+    cooccurrence_matrix = property(lambda self: self._snapshot.cooccurrence_matrix)
+    tag_counts = property(lambda self: self._snapshot.tag_counts)
+    total_visits = property(lambda self: self._snapshot.total_visits)
+    last_updated = property(lambda self: self._snapshot.last_updated)
+    version = property(lambda self: self._snapshot.version)
+    
+    def _build_snapshot(self, version, counts, tag_counts, total_visits, normalized, rows=None):
+        """
+        Create a snapshot, renormalizing the given rows of `normalized`
+        
+        Parameters:
+            version (int): Version of the new snapshot
+            counts (np.ndarray): Raw co-occurrence counts, owned by the snapshot
+            tag_counts (dict): Visits per tag, owned by the snapshot
+            total_visits (int): Visits the counts were built from
+            normalized (np.ndarray): Normalized matrix to fill in, owned by
+                the snapshot
+            rows (array-like, optional): Rows whose counts changed; all rows
+                if not given
         
-        # Version tracking
-        self.version = 1
+        Returns:
+            TagModelSnapshot: The new snapshot, not yet published
+        """
+        if rows is None:
+            rows = np.arange(len(self.tag_list))
+        # Popularity bias of each tag, logarithmic to avoid domination
+        popularity = np.log1p(np.array([tag_counts[tag] for tag in self.tag_list], dtype=float))
+        if len(rows):
+            row_counts = np.array([tag_counts[self.tag_list[row]] for row in rows], dtype=float)[:, None]
+            normalized[rows] = np.divide(
+                counts[rows], row_counts,
+                out=np.zeros((len(rows), len(self.tag_list))), where=row_counts > 0
+            )
+        return TagModelSnapshot(
+            version=version,
+            cooccurrence_counts=_freeze(counts),
+            cooccurrence_matrix=_freeze(normalized),
+            tag_counts=tag_counts,
+            popularity=_freeze(popularity),
+            total_visits=total_visits,
+            last_updated=datetime.now()
+        )
         
     def fit(self, visited_log):
         """
@@ -54,53 +128,121 @@ class TagRecommendationModel:
         start_time = time.time()
         logger.info("Starting model training with %d visit records", len(visited_log))
         
-        # Reset data
-        self.cooccurrence_matrix = np.zeros((len(self.tag_list), len(self.tag_list)))
-        self.tag_counts = {tag: 0 for tag in self.tag_list}
-        self.total_visits = 0
-        self.similarity_cache = {}
-        
-        # Group by user
-        user_visits = defaultdict(list)
-        for visit in visited_log:
-            user_visits[visit["user"]].append(visit["tag"])
-        
-        # Calculate co-occurrence matrix
-        for user, tags in user_visits.items():
-            for i, tag1 in enumerate(tags):
-                if tag1 not in self.tag_to_idx:
-                    logger.warning(f"Tag '{tag1}' not in known tags, skipping")
-                    continue
-                    
-                idx1 = self.tag_to_idx[tag1]
-                self.tag_counts[tag1] += 1
-                
-                # Co-occurrence with other tags
-                for tag2 in tags:
-                    if tag2 not in self.tag_to_idx:
-                        continue
-                    idx2 = self.tag_to_idx[tag2]
-                    self.cooccurrence_matrix[idx1, idx2] += 1
-        
-        self.total_visits = sum(self.tag_counts.values())
-        
-        # Normalize the co-occurrence matrix
-        for i in range(len(self.tag_list)):
-            if self.tag_counts[self.tag_list[i]] > 0:
-                self.cooccurrence_matrix[i, :] /= self.tag_counts[self.tag_list[i]]
-        
-        self.last_updated = datetime.now()
-        self.version += 1
+        # Co-occurrence counts of every pair of visits by the same user are
+        # X^T X for the sparse user x tag visit count matrix X, and the tag
+        # counts are its column sums
+        visit_matrix, users = self._visit_matrix(visited_log)
+        counts = (visit_matrix.T @ visit_matrix).toarray()
+        tag_counts = np.asarray(visit_matrix.sum(axis=0)).ravel()
+        
+        with self._write_lock:
+            self.user_to_idx = {user: idx for idx, user in enumerate(users)}
+            self.user_counts = visit_matrix
+            snapshot = self._build_snapshot(
+                version=self._snapshot.version + 1,
+                counts=counts,
+                tag_counts=dict(zip(self.tag_list, tag_counts.tolist())),
+                total_visits=int(tag_counts.sum()),
+                normalized=np.zeros(counts.shape)
+            )
+            self.similarity_cache = {}
+            # Publishing is a single reference assignment
+            self._snapshot = snapshot
         
         training_time = time.time() - start_time
-        logger.info(f"Model training completed in {training_time:.4f} seconds. Version: {self.version}")
+        logger.info(f"Model training completed in {training_time:.4f} seconds. Version: {snapshot.version}")
         
         return self
     
+    def __getstate__(self):
+        # Pickled as plain attributes, so the format does not depend on the
+        # snapshot class; the normalized matrix is rebuilt after loading
+        snapshot = self._snapshot
+        return {
+            'all_possible_tags': self.all_possible_tags,
+            'tag_list': self.tag_list,
+            'tag_to_idx': self.tag_to_idx,
+            'similarity_cache': self.similarity_cache,
+            'user_to_idx': self.user_to_idx,
+            'user_counts': self.user_counts,
+            'cooccurrence_counts': snapshot.cooccurrence_counts,
+            'tag_counts': snapshot.tag_counts,
+            'total_visits': snapshot.total_visits,
+            'last_updated': snapshot.last_updated,
+            'version': snapshot.version
+        }
+    
+    def __setstate__(self, state):
+        state = dict(state)
+        if 'cooccurrence_counts' not in state:
+            # Models pickled before raw counts were kept only have the
+            # normalized matrix; counts are recovered by undoing the division.
+            # Models that went through update() had drifted and are only
+            # approximated until the next fit.
+            tag_list = state['tag_list']
+            counts = np.array([state['tag_counts'][tag] for tag in tag_list], dtype=float)
+            normalized = state.pop('cooccurrence_matrix')
+            state['cooccurrence_counts'] = np.rint(normalized * counts[:, None]).astype(np.int64)
+            logger.info("Converted a model pickled with normalized co-occurrence to raw counts")
+        self.all_possible_tags = state['all_possible_tags']
+        self.tag_list = state['tag_list']
+        self.tag_to_idx = state['tag_to_idx']
+        self.similarity_cache = state.get('similarity_cache', {})
+        self._write_lock = threading.Lock()
+        if 'user_counts' in state:
+            self.user_to_idx = state['user_to_idx']
+            self.user_counts = state['user_counts']
+        else:
+            # Older pickles did not keep visits per user, so updates cannot
+            # pair new visits with earlier ones until the next fit
+            logger.warning("Model pickled without per-user visit counts; refit it to update it exactly")
+            self.user_to_idx = {}
+            self.user_counts = sparse.csr_matrix((0, len(self.tag_list)), dtype=np.int64)
+        counts = np.array(state['cooccurrence_counts'], dtype=np.int64)
+        self._snapshot = self._build_snapshot(
+            version=state['version'],
+            counts=counts,
+            tag_counts=dict(state['tag_counts']),
+            total_visits=state['total_visits'],
+            normalized=np.zeros(counts.shape)
+        )._replace(last_updated=state['last_updated'])
+    
+    def _visit_matrix(self, visits):
+        """
+        Build the sparse user x tag matrix of visit counts
+        
+        Parameters:
+            visits (list): List of dictionaries containing user and tag
+                information, and optionally a count of visits (default 1)
+        
+        Returns:
+            tuple: (sparse.csr_matrix, pd.Index) the matrix with one row per
+            distinct user, in the order of the returned users, and one column
+            per known tag; visits to unknown tags are skipped with a warning
+        """
+        users = pd.Series([visit["user"] for visit in visits], dtype=object)
+        tags = pd.Series([visit["tag"] for visit in visits], dtype=object)
+        counts = np.array([visit.get("count", 1) for visit in visits], dtype=np.int64)
+        columns = tags.map(self.tag_to_idx)
+        unknown = columns.isna()
+        for tag, count in tags[unknown].value_counts().items():
+            logger.warning(f"Tag '{tag}' not in known tags, skipping {count} visits")
+        
+        rows, distinct_users = pd.factorize(users[~unknown])
+        matrix = sparse.csr_matrix(
+            (counts[~unknown.to_numpy()], (rows, columns[~unknown].to_numpy(dtype=np.int64))),
+            shape=(len(distinct_users), len(self.tag_list))
+        )
+        return matrix, distinct_users
+    
     def update(self, new_history, batch_update=True):
         """
         Update the model with new visit data
         
+        The new version is built next to the current one and published in
+        one step, so concurrent recommend calls keep reading the version they
+        started with.
+        
         Parameters:
             new_history (list): List of dictionaries with user and tag information
             batch_update (bool): Whether to batch multiple updates
@@ -112,69 +254,93 @@ class TagRecommendationModel:
         start_time = time.time()
         logger.info(f"Updating model with {len(new_history)} new records")
         
-        # Group by user
-        user_visits = defaultdict(list)
-        for visit in new_history:
-            tag = visit["tag"]
-            if tag not in self.tag_to_idx:
-                logger.warning(f"Tag '{tag}' not in known tags, skipping")
-                continue
-            user_visits[visit["user"]].append(tag)
-        
-        # Update co-occurrence matrix and tag counts
-        affected_tags = set()
-        for user, tags in user_visits.items():
-            for tag1 in tags:
-                idx1 = self.tag_to_idx[tag1]
-                self.tag_counts[tag1] += 1
-                affected_tags.add(tag1)
-                
-                # Co-occurrence with other tags
-                for tag2 in tags:
-                    idx2 = self.tag_to_idx[tag2]
-                    self.cooccurrence_matrix[idx1, idx2] += 1
-        
-        self.total_visits += sum(len(tags) for tags in user_visits.values())
-        
-        # Re-normalize affected rows in the co-occurrence matrix
-        for tag in affected_tags:
-            idx = self.tag_to_idx[tag]
-            if self.tag_counts[tag] > 0:
-                self.cooccurrence_matrix[idx, :] = self.cooccurrence_matrix[idx, :] / self.tag_counts[tag]
-        
-        # Clear affected cache entries
-        for tag in affected_tags:
-            if tag in self.similarity_cache:
-                del self.similarity_cache[tag]
-        
-        self.last_updated = datetime.now()
-        self.version += 1
+        visit_matrix, users = self._visit_matrix(new_history)
+        new_counts = np.asarray(visit_matrix.sum(axis=0)).ravel()
+        
+        with self._write_lock:
+            # Rows of the batch's users in user_counts; new users are added
+            rows = np.array([self.user_to_idx.get(user, -1) for user in users], dtype=np.int64)
+            is_new = rows < 0
+            rows[is_new] = np.arange(self.user_counts.shape[0], self.user_counts.shape[0] + is_new.sum())
+            user_counts = sparse.vstack([
+                self.user_counts, sparse.csr_matrix((int(is_new.sum()), len(self.tag_list)), dtype=np.int64)
+            ]).tocsr()
+            
+            # With X the batch users' earlier counts and D their new ones,
+            # the counts grow from X^T X to (X + D)^T (X + D), so the new
+            # pairs are X^T D + D^T X + D^T D, as a fit on all visits counts
+            prior = user_counts[rows]
+            cross = prior.T @ visit_matrix
+            new_pairs = (cross + cross.T + visit_matrix.T @ visit_matrix).tocoo()
+            batch = visit_matrix.tocoo()
+            user_counts = user_counts + sparse.csr_matrix(
+                (batch.data, (rows[batch.row], batch.col)), shape=user_counts.shape
+            )
+            
+            # Only rows of tags paired with a new visit change, so only they
+            # are renormalized in the copy of the current matrix
+            affected = np.union1d(new_pairs.row, np.flatnonzero(new_counts))
+            current = self._snapshot
+            counts = current.cooccurrence_counts.copy()
+            counts[new_pairs.row, new_pairs.col] += new_pairs.data
+            tag_counts = dict(current.tag_counts)
+            for idx in np.flatnonzero(new_counts):
+                tag_counts[self.tag_list[idx]] += int(new_counts[idx])
+            snapshot = self._build_snapshot(
+                version=current.version + 1,
+                counts=counts,
+                tag_counts=tag_counts,
+                total_visits=current.total_visits + int(new_counts.sum()),
+                normalized=current.cooccurrence_matrix.copy(),
+                rows=affected
+            )
+            
+            # Clear affected cache entries
+            for idx in affected:
+                self.similarity_cache.pop(self.tag_list[idx], None)
+            
+            for user, row in zip(users[is_new], rows[is_new]):
+                self.user_to_idx[user] = int(row)
+            self.user_counts = user_counts
+            self._snapshot = snapshot
         
         update_time = time.time() - start_time
-        logger.info(f"Model update completed in {update_time:.4f} seconds. Version: {self.version}")
+        logger.info(f"Model update completed in {update_time:.4f} seconds. Version: {snapshot.version}")
         
         return self
     
-    def recommend(self, user_history, top_n=3):
+    def recommend(self, user_history, top_n=3, return_version=False):
         """
         Recommend tags based on user's history
         
+        The whole call reads the snapshot that was current when it started,
+        without locking, even if an update is published meanwhile.
+        
         Parameters:
             user_history (list): List of dictionaries with 'tag' and 'count' for a single user
             top_n (int): Number of tags to recommend
+            return_version (bool): Also return the model version that served
+                the recommendations
             
         Returns:
-            List of recommended tags
+            List of recommended tags, or a (tags, version) tuple if
+            return_version is set
         """
         start_time = time.time()
+        snapshot = self._snapshot
+        tag_counts = snapshot.tag_counts
+        
+        def served(result, kind):
+            logger.info(f"Generated {len(result)} {kind} in {time.time() - start_time:.4f}s "
+                        f"from model version {snapshot.version}")
+            return (result, snapshot.version) if return_version else result
         
         # Handle empty history case
         if not user_history:
             # Return popular tags
-            popular_tags = sorted(self.tag_counts.items(), key=lambda x: x[1], reverse=True)
+            popular_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)
             result = [tag for tag, _ in popular_tags[:top_n]]
-            logger.info(f"Generated {len(result)} recommendations for new user in {time.time() - start_time:.4f}s")
-            return result
+            return served(result, "recommendations for new user")
         
         # Convert user history to vector
         user_tags = {}
@@ -190,10 +356,9 @@ class TagRecommendationModel:
         
         # Skip if no valid tags in history
         if not user_tags:
-            popular_tags = sorted(self.tag_counts.items(), key=lambda x: x[1], reverse=True)
+            popular_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)
             result = [tag for tag, _ in popular_tags[:top_n]]
-            logger.info(f"Generated {len(result)} popularity-based recommendations in {time.time() - start_time:.4f}s")
-            return result
+            return served(result, "popularity-based recommendations")
         
         # Calculate weighted similarity scores for each tag
         scores = {}
@@ -208,7 +373,7 @@ class TagRecommendationModel:
         user_vector = user_vector / total_count if total_count > 0 else user_vector
         
         # Get similarity scores for all tags at once
-        tag_scores = np.matmul(user_vector, self.cooccurrence_matrix)
+        tag_scores = np.matmul(user_vector, snapshot.cooccurrence_matrix)
         
         # Apply popularity bias and filter out visited tags
         for tag in self.tag_list:
@@ -217,8 +382,7 @@ class TagRecommendationModel:
                 score = tag_scores[idx]
                 
                 # Apply popularity bias (logarithmic to avoid domination)
-                popularity_factor = np.log1p(self.tag_counts[tag]) if self.tag_counts[tag] > 0 else 0
-                score = score * 0.8 + popularity_factor * 0.2
+                score = score * 0.8 + snapshot.popularity[idx] * 0.2
                 
                 scores[tag] = score
         
@@ -232,8 +396,106 @@ class TagRecommendationModel:
             recommendations.extend([(tag, 0) for tag in remaining_tags])
         
         result = [tag for tag, _ in recommendations[:top_n]]
-        logger.info(f"Generated {len(result)} recommendations in {time.time() - start_time:.4f}s")
-        return result
+        return served(result, "recommendations")
+    
+    def recommend_batch(self, histories, top_n=3, return_version=False, chunk_size=10000):
+        """
+        Recommend tags for many users at once
+        
+        Gives the same recommendations as calling recommend for each user,
+        apart from the order of tags with equal scores, and from users who
+        have visited nearly every tag getting fewer than top_n tags instead
+        of random ones. All users are served from the same snapshot.
+        
+        Parameters:
+            histories (list or dict): One user history per user, as taken by
+                recommend, or a dict mapping user ids to histories
+            top_n (int): Number of tags to recommend per user
+            return_version (bool): Also return the model version that served
+                the recommendations
+            chunk_size (int): Users scored per matrix product, bounding the
+                memory of the dense score matrix
+            
+        Returns:
+            A list with the recommended tags of each user, or a dict keyed by
+            user id if histories is a dict; a (recommendations, version)
+            tuple if return_version is set
+        """
+        start_time = time.time()
+        snapshot = self._snapshot
+        
+        user_ids = list(histories) if isinstance(histories, dict) else None
+        histories = list(histories.values()) if user_ids is not None else list(histories)
+        num_users = len(histories)
+        num_tags = len(self.tag_list)
+        
+        rows, tags, counts = [], [], []
+        for row, user_history in enumerate(histories):
+            for item in user_history or ():
+                rows.append(row)
+                tags.append(item['tag'])
+                counts.append(item['count'])
+        tags = pd.Series(tags, dtype=object)
+        columns = tags.map(self.tag_to_idx)
+        unknown = columns.isna()
+        for tag, count in tags[unknown].value_counts().items():
+            logger.warning(f"Tag '{tag}' in user history not found in model, skipping {count} entries")
+        
+        # As in recommend, a tag listed twice for a user keeps its last count
+        entries = pd.DataFrame({
+            'row': np.array(rows, dtype=np.int64)[~unknown.to_numpy()],
+            'col': columns[~unknown].to_numpy(dtype=np.int64),
+            'count': np.array(counts, dtype=float)[~unknown.to_numpy()]
+        }).drop_duplicates(['row', 'col'], keep='last')
+        row_idx = entries['row'].to_numpy()
+        col_idx = entries['col'].to_numpy()
+        values = entries['count'].to_numpy()
+        
+        # Each user's counts divided by their total, stacked into one sparse
+        # user x tag matrix, plus a matrix marking the visited tags
+        totals = np.bincount(row_idx, weights=values, minlength=num_users)[row_idx]
+        values = np.divide(values, totals, out=values.copy(), where=totals > 0)
+        history_matrix = sparse.csr_matrix((values, (row_idx, col_idx)), shape=(num_users, num_tags))
+        visited = sparse.csr_matrix((np.ones(len(row_idx)), (row_idx, col_idx)), shape=(num_users, num_tags))
+        has_history = np.bincount(row_idx, minlength=num_users) > 0
+        
+        # Users without any known tag get the most popular tags
+        popular = [self.tag_list[idx] for idx in np.argsort(-snapshot.popularity, kind='stable')[:top_n]]
+        k = min(top_n, num_tags)
+        results = []
+        for start in range(0, num_users, chunk_size):
+            stop = min(start + chunk_size, num_users)
+            scores = np.asarray(history_matrix[start:stop] @ snapshot.cooccurrence_matrix)
+            scores *= 0.8
+            scores += 0.2 * snapshot.popularity
+            chunk_visited = visited[start:stop]
+            scores[np.repeat(np.arange(stop - start), np.diff(chunk_visited.indptr)), chunk_visited.indices] = -np.inf
+            
+            # Unordered top k of each row, then sorted by descending score
+            if k <= 0:
+                top = np.zeros((stop - start, 0), dtype=np.int64)
+            elif k < num_tags:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(num_tags), (stop - start, 1))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            
+            for offset in range(stop - start):
+                if not has_history[start + offset]:
+                    results.append(list(popular))
+                    continue
+                results.append([self.tag_list[idx]
+                                for idx, score in zip(top[offset], top_scores[offset]) if score != -np.inf])
+        
+        elapsed = time.time() - start_time
+        logger.info(f"Generated recommendations for {num_users} users in {elapsed:.4f}s "
+                    f"from model version {snapshot.version}")
+        if user_ids is not None:
+            results = dict(zip(user_ids, results))
+        return (results, snapshot.version) if return_version else results
     
     def save(self, filepath):
         """Save the model to a file"""
@@ -252,13 +514,14 @@ class TagRecommendationModel:
         return model
     
     def get_info(self):
-        """Return model information"""
+        """Return information about the current snapshot"""
+        snapshot = self._snapshot
         return {
-            "version": self.version,
+            "version": snapshot.version,
             "tags_count": len(self.tag_list),
-            "total_visits": self.total_visits,
-            "last_updated": self.last_updated.isoformat(),
-            "most_popular_tags": sorted(self.tag_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+            "total_visits": snapshot.total_visits,
+            "last_updated": snapshot.last_updated.isoformat(),
+            "most_popular_tags": sorted(snapshot.tag_counts.items(), key=lambda x: x[1], reverse=True)[:5]
         }
 
 
@@ -274,7 +537,18 @@ class TagRecommenderService:
                 cls._instance._initialized = False
             return cls._instance
     
-    def __init__(self, model_path="tag_recommendation_model.pkl", all_possible_tags=None):
+    def __init__(self, model_path="tag_recommendation_model.pkl", all_possible_tags=None,
+                 batch_update_size=50, max_update_latency=1.0, save_interval=30.0):
+        """
+        Parameters:
+            model_path (str): Pickle file the model is loaded from and saved to
+            all_possible_tags (set): Tags for a new model if none can be loaded
+            batch_update_size (int): Queued visits that trigger an update
+            max_update_latency (float): Seconds a queued visit may wait before
+                it is applied, however few visits are queued
+            save_interval (float): Minimum seconds between saves after
+                background updates; stop() always saves pending changes
+        """
         # Only initialize once
         if self._initialized:
             return
@@ -282,12 +556,32 @@ class TagRecommenderService:
         self._model_path = model_path
         self._model = None
         self._all_possible_tags = all_possible_tags
-        self._update_queue = []
-        self._batch_update_size = 50
+        self._batch_update_size = batch_update_size
+        self._max_update_latency = max_update_latency
+        self._save_interval = save_interval
         self._batch_update_thread = None
         self._should_stop = False
         self._lock = threading.Lock()
         
+        # Queued visits, coalesced into a count per (user, tag). The worker
+        # waits on the condition and is woken by every enqueue.
+        self._update_condition = threading.Condition(self._lock)
+        self._pending = Counter()
+        self._pending_visits = 0
+        self._oldest_pending = None
+        
+        # Serializes model updates between the worker and force_update
+        self._update_lock = threading.Lock()
+        self._unsaved_changes = False
+        self._last_save = time.monotonic()
+        
+        # Flush statistics
+        self._flushes = 0
+        self._flushed_visits = 0
+        self._last_flush_latency = None
+        self._max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+        
         # Try to load the model
         self._load_or_create_model()
         
@@ -319,92 +613,168 @@ class TagRecommenderService:
         self._batch_update_thread.daemon = True
         self._batch_update_thread.start()
     
+    def _enqueue(self, user_id, tag, count):
+        # Called with self._lock held
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        self._pending[(user_id, tag)] += count
+        self._pending_visits += count
+        self._update_condition.notify()
+    
+    def _take_pending(self):
+        # Called with self._lock held
+        batch = [{"user": user, "tag": tag, "count": count} for (user, tag), count in self._pending.items()]
+        oldest = self._oldest_pending
+        self._pending = Counter()
+        self._pending_visits = 0
+        self._oldest_pending = None
+        return batch, oldest
+    
     def _batch_update_worker(self):
-        """Background worker to process batch updates"""
-        while not self._should_stop:
-            if len(self._update_queue) >= self._batch_update_size:
-                with self._lock:
-                    batch = self._update_queue[:self._batch_update_size]
-                    self._update_queue = self._update_queue[self._batch_update_size:]
-                
-                # Update the model with the batch
-                try:
-                    self._model.update(batch)
-                    # Save the model after batch update
-                    self._model.save(self._model_path)
-                except Exception as e:
-                    logger.error(f"Error in batch update: {str(e)}")
+        """
+        Background worker applying queued visits once batch_update_size have
+        been queued or the oldest has waited max_update_latency seconds, and
+        saving applied changes save_interval seconds after the last save
+        """
+        while True:
+            with self._update_condition:
+                while not self._should_stop:
+                    if self._pending_visits >= self._batch_update_size:
+                        break
+                    # Wake for the oldest queued visit or for unsaved changes,
+                    # whichever is due first
+                    deadlines = []
+                    if self._oldest_pending is not None:
+                        deadlines.append(self._oldest_pending + self._max_update_latency)
+                    if self._unsaved_changes:
+                        deadlines.append(self._last_save + self._save_interval)
+                    if not deadlines:
+                        self._update_condition.wait()
+                        continue
+                    remaining = min(deadlines) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._update_condition.wait(remaining)
+                if self._should_stop:
+                    # stop() applies whatever is still queued
+                    return
+                if self._oldest_pending is not None and (
+                        self._pending_visits >= self._batch_update_size or
+                        time.monotonic() >= self._oldest_pending + self._max_update_latency):
+                    batch, oldest = self._take_pending()
+                else:
+                    batch, oldest = [], None
             
-            # Sleep before next check
-            time.sleep(1)
+            try:
+                self._apply_batch(batch, oldest)
+                # Saving pickles the whole model, so it is rate limited
+                if time.monotonic() - self._last_save >= self._save_interval:
+                    self._save()
+            except Exception as e:
+                logger.error(f"Error in batch update: {str(e)}")
+    
+    def _apply_batch(self, batch, oldest):
+        """Update the model with a coalesced batch and record the flush"""
+        if not batch:
+            return
+        with self._update_lock:
+            self._model.update(batch)
+            self._unsaved_changes = True
+        latency = time.monotonic() - oldest
+        with self._lock:
+            self._flushes += 1
+            self._flushed_visits += sum(visit["count"] for visit in batch)
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            self._total_flush_latency += latency
+    
+    def _save(self):
+        with self._update_lock:
+            if not self._unsaved_changes:
+                return
+            # Set first so a failing save is retried after save_interval
+            # rather than straight away
+            self._last_save = time.monotonic()
+            self._model.save(self._model_path)
+            self._unsaved_changes = False
     
     def stop(self):
         """Stop the service and save model"""
-        self._should_stop = True
+        with self._update_condition:
+            self._should_stop = True
+            self._update_condition.notify_all()
         if self._batch_update_thread:
             self._batch_update_thread.join(timeout=5)
         
         # Process any remaining updates
-        with self._lock:
-            if self._update_queue:
-                try:
-                    self._model.update(self._update_queue)
-                    self._model.save(self._model_path)
-                    self._update_queue = []
-                except Exception as e:
-                    logger.error(f"Error in final update: {str(e)}")
-    
-    def get_recommendations(self, user_history, top_n=3):
-        """Get recommendations for a user"""
+        try:
+            self.force_update()
+        except Exception as e:
+            logger.error(f"Error in final update: {str(e)}")
+    
+    def get_recommendations(self, user_history, top_n=3, return_version=False):
+        """
+        Get recommendations for a user
+        
+        Recommendations are read lock-free from the model's current snapshot;
+        with return_version, a (tags, version) tuple is returned instead.
+        """
+        if not self._model:
+            raise RuntimeError("Model not initialized")
+        
+        return self._model.recommend(user_history, top_n, return_version=return_version)
+    
+    def get_batch_recommendations(self, histories, top_n=3, return_version=False):
+        """Get recommendations for many users at once, see TagRecommendationModel.recommend_batch"""
         if not self._model:
             raise RuntimeError("Model not initialized")
         
-        return self._model.recommend(user_history, top_n)
+        return self._model.recommend_batch(histories, top_n, return_version=return_version)
     
     def add_visit(self, user_id, tag, count=1):
         """Add a new visit to the update queue"""
-        visit = {"user": user_id, "tag": tag}
         with self._lock:
-            self._update_queue.append(visit)
-        
-        # Immediate update if queue is getting large
-        if len(self._update_queue) >= self._batch_update_size * 2:
-            self.force_update()
+            self._enqueue(user_id, tag, count)
     
     def add_user_history(self, user_id, tags_with_counts):
         """Add multiple tags from user history"""
-        visits = []
-        for item in tags_with_counts:
-            tag = item['tag']
-            count = item.get('count', 1)
-            for _ in range(count):
-                visits.append({"user": user_id, "tag": tag})
-        
         with self._lock:
-            self._update_queue.extend(visits)
+            for item in tags_with_counts:
+                self._enqueue(user_id, item['tag'], item.get('count', 1))
     
     def force_update(self):
-        """Force an immediate update with all queued data"""
+        """Apply all queued visits now and save the model"""
         with self._lock:
-            if not self._update_queue:
-                return
-            
-            batch = self._update_queue
-            self._update_queue = []
+            batch, oldest = self._take_pending()
         
         try:
-            self._model.update(batch)
-            self._model.save(self._model_path)
+            self._apply_batch(batch, oldest)
+            self._save()
         except Exception as e:
             logger.error(f"Error in forced update: {str(e)}")
     
+    def get_queue_stats(self):
+        """Return queue depth and flush counts and latencies"""
+        with self._lock:
+            return {
+                "pending_visits": self._pending_visits,
+                "pending_keys": len(self._pending),
+                "oldest_pending_age": time.monotonic() - self._oldest_pending if self._oldest_pending else 0.0,
+                "flushes": self._flushes,
+                "flushed_visits": self._flushed_visits,
+                "last_flush_latency": self._last_flush_latency,
+                "max_flush_latency": self._max_flush_latency,
+                "mean_flush_latency": self._total_flush_latency / self._flushes if self._flushes else 0.0
+            }
+    
     def get_model_info(self):
         """Get information about the current model"""
         if not self._model:
             return {"status": "not_initialized"}
         
         info = self._model.get_info()
-        info["pending_updates"] = len(self._update_queue)
+        info["pending_updates"] = self._pending_visits
+        info["update_queue"] = self.get_queue_stats()
         return info
     
     def train_model(self, visited_log):
@@ -414,11 +784,14 @@ class TagRecommenderService:
         
         # Clear update queue first
         with self._lock:
-            self._update_queue = []
+            self._take_pending()
         
         # Train the model
-        self._model.fit(visited_log)
-        self._model.save(self._model_path)
+        with self._update_lock:
+            self._model.fit(visited_log)
+            self._model.save(self._model_path)
+            self._unsaved_changes = False
+            self._last_save = time.monotonic()
         
         return self._model.get_info()
 
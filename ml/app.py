@@ -1,24 +1,146 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+import os
 import joblib
 import numpy as np
 from Amount import UPIMessageExtractor
+from inference import load_classifier, predict_upi_message, predict_upi_messages, extract_sender, encode_senders, preprocess_text
+from template_cache import TemplateCache, fingerprint, map_fields, apply_fields
+from history_store import HistoryStore, HISTORY_DB_PATH
+from model_registry import file_lock
+from micro_batcher import MicroBatcher
+from background_jobs import BackgroundJobs
+from metrics import registry as metrics_registry, time_stage, REQUESTS, REQUEST_ERRORS, REQUEST_LATENCY
+from profiling import RequestProfiler
+import hmac
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 import random
+import copy
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that times request decoding and response serialization"""
+    
+    def loads(self, s, **kwargs):
+        with time_stage('json_decode'):
+            return super().loads(s, **kwargs)
+    
+    def dumps(self, obj, **kwargs):
+        with time_stage('serialization'):
+            return super().dumps(obj, **kwargs)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
+
+# Profiling of live requests. /admin/profile arms it when PROFILING_TOKEN is
+# set; PROFILE_REQUESTS=N profiles the first N requests after startup (of
+# PROFILE_ROUTE only, if set) and logs the results.
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+request_profiler = RequestProfiler()
+if int(os.environ.get('PROFILE_REQUESTS', '0')) > 0:
+    request_profiler.arm(
+        requests=int(os.environ['PROFILE_REQUESTS']),
+        route=os.environ.get('PROFILE_ROUTE'),
+        mode=os.environ.get('PROFILE_MODE', 'cprofile')
+    )
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if request_profiler.armed:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.profile_token = request_profiler.start(route)
+
+@app.teardown_request
+def stop_request_profile(exc):
+    token = g.pop('profile_token', None)
+    if token is not None:
+        request_profiler.stop(token)
+
+@app.after_request
+def record_request_metrics(response):
+    """Count every request and its latency under its route pattern"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS.inc(route, response.status_code)
+    if response.status_code >= 400:
+        REQUEST_ERRORS.inc(route)
+    if 'request_start' in g:
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, route)
+    return response
 
 # Load pre-trained model and label encoder
 try:
-    model = joblib.load('upi_classifier_model.pkl')
-    label_encoder = joblib.load('sender_label_encoder.pkl')
+    model, label_encoder = load_classifier()
 except FileNotFoundError:
+    # Training dependencies are only imported when there is nothing to load
     from model import train_upi_classifier
     model, label_encoder = train_upi_classifier()
 
-# Initialize the message extractor
-message_extractor = UPIMessageExtractor()
+# Initialize the message extractor. Well-formed bank templates are answered by
+# rules; EXTRACTION_FAST_PATH=0 sends every message through the models instead.
+message_extractor = UPIMessageExtractor(
+    fast_path=os.environ.get('EXTRACTION_FAST_PATH', '1') != '0',
+    min_confidence=float(os.environ.get('EXTRACTION_MIN_CONFIDENCE', '1.0'))
+)
+
+# Load the extraction bundle once per process and hot-reload it when the file changes
+extraction_registry = message_extractor.registry
+try:
+    extraction_registry.get()
+except FileNotFoundError:
+    print("No extraction models found. Will train on first request.")
+reload_interval = float(os.environ.get('MODEL_RELOAD_INTERVAL', '30'))
+if reload_interval > 0:
+    extraction_registry.start_watcher(reload_interval)
+
+# Upper bound on messages accepted by the batch endpoints
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '500'))
+
+# Classifications cached per classifier input, rule based extractions per SMS
+# template skeleton; TEMPLATE_CACHE_SIZE=0 disables caching
+template_cache_size = int(os.environ.get('TEMPLATE_CACHE_SIZE', '4096'))
+classification_cache = TemplateCache(template_cache_size)
+extraction_cache = TemplateCache(template_cache_size)
+
+# Single messages from concurrent /predict and /extract_details requests are
+# collected for up to MICRO_BATCH_WINDOW_MS and run as one batch;
+# MICRO_BATCH_WINDOW_MS=0 runs every message on its own request thread, as
+# do requests being profiled so their work shows up in their profile
+micro_batch_window = float(os.environ.get('MICRO_BATCH_WINDOW_MS', '2')) / 1000
+micro_batch_size = int(os.environ.get('MICRO_BATCH_SIZE', '32'))
+classification_batcher = MicroBatcher(
+    lambda messages: predict_upi_messages(model, label_encoder, messages),
+    micro_batch_size, micro_batch_window, name='classification'
+)
+extraction_batcher = MicroBatcher(
+    lambda messages: message_extractor.predict_details_batch(messages),
+    micro_batch_size, micro_batch_window, name='extraction'
+)
+
+# Serving state exported on /metrics next to the request and stage timings
+_batchers = {'classification': classification_batcher, 'extraction': extraction_batcher}
+_template_caches = {'classification': classification_cache, 'extraction': extraction_cache}
+metrics_registry.gauge(
+    'ml_batch_queue_depth', 'Messages waiting for the next micro-batch', ('batcher',),
+    lambda: {(name, ): b.get_stats()['queue_depth'] for name, b in _batchers.items()}
+)
+metrics_registry.gauge(
+    'ml_batch_mean_size', 'Mean number of messages per micro-batch', ('batcher',),
+    lambda: {(name, ): b.get_stats()['mean_batch_size'] for name, b in _batchers.items()}
+)
+metrics_registry.gauge(
+    'ml_batch_mean_wait_seconds', 'Mean wait added by micro-batching', ('batcher',),
+    lambda: {(name, ): b.get_stats()['mean_wait_ms'] / 1000 for name, b in _batchers.items()}
+)
+metrics_registry.gauge(
+    'ml_template_cache_hit_rate', 'Template cache hit rate', ('cache',),
+    lambda: {(name, ): c.get_stats()['hit_rate'] for name, c in _template_caches.items()}
+)
 
 # Define all possible tags for recommendations
 all_possible_tags = {
@@ -44,13 +166,80 @@ for category, places in category_relationships.items():
     for place in places:
         category_mapping[place] = category
 
+# Upper bound on similarity entries computed at once while finding neighbors
+SIMILARITY_BLOCK_ELEMENTS = 1 << 22
+
+# On-disk layout of saved recommendation models, and the pickle file used
+# before it
+RECOMMENDATION_MODEL_PATH = 'recommendation_model'
+MODEL_FORMAT_VERSION = 1
+LEGACY_MODEL_PATH = 'recommendation_model.pkl'
+
+# With SHARED_MODELS=1 (the default under gunicorn.conf.py) every worker
+# serves the recommendation model memory-mapped from RECOMMENDATION_MODEL_PATH.
+# Retrains are saved there under a cross-process lock, and workers follow the
+# generation in its header instead of keeping copies that drift apart.
+# Incremental updates are saved at most every SHARED_SAVE_INTERVAL seconds;
+# in between, each worker applies the entries other workers ingested from the
+# history store, checking at most every SHARED_SYNC_INTERVAL seconds.
+SHARED_MODELS = os.environ.get('SHARED_MODELS', '0') == '1'
+SHARED_SAVE_INTERVAL = float(os.environ.get('SHARED_SAVE_INTERVAL', '30'))
+SHARED_SYNC_INTERVAL = float(os.environ.get('SHARED_SYNC_INTERVAL', '1'))
+
+# Visits lose weight as exp(-DECAY_RATE * age in days). Weights are stored
+# relative to a reference epoch that is moved forward after REBASE_AFTER_DAYS
+# so the stored values stay well within float range.
+DECAY_RATE = 0.1
+REBASE_AFTER_DAYS = 180
+
+def _top_k(scores, k, ids=None):
+    """
+    Select the k largest scores of every row, most similar first
+
+    Parameters:
+        scores (np.ndarray): Candidate scores, one row per user
+        k (int): Number of neighbors to keep
+        ids (np.ndarray, optional): User index of each candidate; defaults to
+            the column position
+
+    Returns:
+        tuple: (indices, scores) with index -1 and score 0 wherever fewer than
+        k candidates have positive similarity
+    """
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    if ids is not None:
+        top = np.take_along_axis(ids, top, axis=1)
+    positive = top_scores > 0
+    return np.where(positive, top, -1).astype(np.int32), np.where(positive, top_scores, 0).astype(np.float32)
+
 class RecommendationModel:
-    def __init__(self):
-        self.user_similarity = None
+    def __init__(self, n_neighbors=50):
+        """
+        Parameters:
+            n_neighbors (int): Number of most similar users kept per user
+        """
+        self.n_neighbors = n_neighbors
         self.user_tag_matrix = None
-        self.df = None
+        self.user_norms = None
+        self.users = None
+        self.user_order = None
+        self.tags = None
+        self.tag_index = None
+        self.tag_categories = None
+        self.tag_category_codes = None
+        self.category_names = None
+        self.recommendable_tags = None
+        self.neighbor_indices = None
+        self.neighbor_scores = None
+        self.epoch = None
         self.last_training_time = None
-        self.category_weights = None
+        self.generation = None
+        # Highest history store id applied, None if trained without ids
+        self.history_id = None
         
     def train(self, history_data):
         """
@@ -60,46 +249,29 @@ class RecommendationModel:
             history_data (list): List of history entries with user, tag, and count
         """
         try:
-            # Convert history data to DataFrame with timestamp
-            self.df = pd.DataFrame(history_data)
+            # Convert history data to DataFrame with weights at a new epoch
+            self.epoch = pd.Timestamp.now(tz='UTC')
+            df = self._weight_history(history_data, self.epoch)
             
-            # Add time decay factor (more recent visits have higher weight)
-            if 'timestamp' in self.df.columns:
-                self.df['time_weight'] = self.df['timestamp'].apply(
-                    lambda x: np.exp(-0.1 * (pd.Timestamp.now() - pd.Timestamp(x)).days)
-                )
-            else:
-                self.df['time_weight'] = 1.0
-            
-            # Weighted count based on time
-            self.df['weighted_count'] = self.df['count'] * self.df['time_weight']
-            
-            # Create user-tag matrix with weighted counts
-            self.user_tag_matrix = self.df.pivot_table(
-                index='user',
-                columns='tag',
-                values='weighted_count',
-                aggfunc='sum',
-                fill_value=0
-            )
+            # Create sparse user-tag matrix with weighted counts; duplicate
+            # (user, tag) entries are summed when converting to CSR, so the
+            # raw history is not kept. Users and tags are kept as fixed-width
+            # string arrays, sorted, so they can be saved and memory-mapped.
+            user_codes, users = pd.factorize(df['user'].astype(str), sort=True)
+            tag_codes, tags = pd.factorize(df['tag'], sort=True)
+            self.users = np.asarray(users, dtype=str)
+            self.user_order = np.arange(len(self.users))
+            self.tags = np.asarray(tags, dtype=str)
+            self._build_tag_indexes()
+            self.user_tag_matrix = sparse.coo_matrix(
+                (df['weighted_count'].to_numpy(dtype=float), (user_codes, tag_codes)),
+                shape=(len(self.users), len(self.tags))
+            ).tocsr()
+            self.user_norms = self._row_norms(self.user_tag_matrix)
+            self.history_id = int(df['id'].max()) if 'id' in df.columns and len(df) else None
             
-            # Calculate category weights for each user
-            self.category_weights = {}
-            for user in self.user_tag_matrix.index:
-                user_tags = self.df[self.df['user'] == user]
-                category_counts = {}
-                for _, row in user_tags.iterrows():
-                    tag = row['tag']
-                    category = category_mapping.get(tag, 'other')
-                    category_counts[category] = category_counts.get(category, 0) + row['weighted_count']
-                self.category_weights[user] = category_counts
-            
-            # Compute user similarity matrix with category weights
-            self.user_similarity = pd.DataFrame(
-                cosine_similarity(self.user_tag_matrix),
-                index=self.user_tag_matrix.index,
-                columns=self.user_tag_matrix.index
-            )
+            # Keep only the most similar users of each user
+            self.neighbor_indices, self.neighbor_scores = self._build_neighbors()
             
             self.last_training_time = pd.Timestamp.now()
             return True
@@ -108,67 +280,701 @@ class RecommendationModel:
             print(f"Error training model: {str(e)}")
             return False
     
-    def save_model(self, filepath='recommendation_model.pkl'):
-        """Save the trained model to disk"""
+    def update(self, history_data):
+        """
+        Apply new history entries without retraining from scratch
+        
+        The current model is left untouched: a new model sharing the
+        unchanged parts is built and returned, so the caller can publish it
+        with one reference assignment while readers keep using this one.
+        Only the users in the new entries get their row and norm recomputed,
+        and only neighbor lists they affect are touched. Entries from the
+        history store whose id is not above history_id are already in the
+        model and are skipped.
+        
+        Parameters:
+            history_data (list): List of history entries with user, tag, and count
+        
+        Returns:
+            RecommendationModel: The updated model, this model if every entry
+            was already applied, or None on error
+        """
         try:
-            model_data = {
-                'user_similarity': self.user_similarity,
-                'user_tag_matrix': self.user_tag_matrix,
-                'df': self.df,
-                'last_training_time': self.last_training_time,
-                'category_weights': self.category_weights
+            history_data = pd.DataFrame(history_data)
+            if self.history_id is not None and 'id' in history_data.columns:
+                history_data = history_data[history_data['id'] > self.history_id]
+                if history_data.empty:
+                    return self
+            
+            if self.user_tag_matrix is None:
+                model = RecommendationModel(self.n_neighbors)
+                return model if model.train(history_data) else None
+            
+            model = copy.copy(self)
+            if pd.Timestamp.now(tz='UTC') - self.epoch > pd.Timedelta(days=REBASE_AFTER_DAYS):
+                model._rebase()
+            events = self._weight_history(history_data, model.epoch)
+            if 'id' in events.columns:
+                model.history_id = max(self.history_id or 0, int(events['id'].max()))
+            
+            # Register users and tags seen for the first time; new users get
+            # the next rows and are inserted into the sorted lookup order
+            new_users = np.unique(events.loc[self.get_user_rows(events['user']) < 0, 'user'].to_numpy(dtype=str))
+            new_tags = pd.unique(events.loc[~events['tag'].isin(self.tag_index), 'tag'])
+            if len(new_users):
+                positions = np.searchsorted(self.users, new_users, sorter=self.user_order)
+                model.users = np.concatenate([self.users, new_users])
+                model.user_order = np.insert(self.user_order, positions, np.arange(len(self.users), len(model.users)))
+            if len(new_tags):
+                model.tags = np.concatenate([self.tags, np.asarray(new_tags, dtype=str)])
+                model._build_tag_indexes()
+            
+            # Add the new weighted counts to a matrix grown to the new shape
+            shape = (len(model.users), len(model.tags))
+            rows = model.get_user_rows(events['user'])
+            columns = events['tag'].map(model.tag_index).to_numpy()
+            old = model.user_tag_matrix
+            indptr = np.concatenate([old.indptr, np.full(len(new_users), old.indptr[-1], dtype=old.indptr.dtype)])
+            model.user_tag_matrix = sparse.csr_matrix((old.data, old.indices, indptr), shape=shape) + \
+                sparse.coo_matrix((events['weighted_count'].to_numpy(dtype=float), (rows, columns)), shape=shape).tocsr()
+            
+            changed = np.unique(rows)
+            model.user_norms = np.concatenate([model.user_norms, np.zeros(len(new_users))])
+            model.user_norms[changed] = model._row_norms(model.user_tag_matrix[changed])
+            
+            if self.neighbor_indices.shape[1] < min(self.n_neighbors, len(model.users) - 1):
+                # Lists were capped by the old user count, so they need to grow
+                model.neighbor_indices, model.neighbor_scores = model._build_neighbors()
+            else:
+                model.neighbor_indices, model.neighbor_scores = model._update_neighbors(changed, len(new_users))
+            
+            model.last_training_time = pd.Timestamp.now()
+            return model
+            
+        except Exception as e:
+            print(f"Error updating model: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _weight_history(history_data, epoch):
+        """
+        Build the history DataFrame with time-decayed weighted counts
+        
+        Weights are expressed at `epoch`: a visit at time t gets
+        count * exp(DECAY_RATE * (t - epoch) in days), so visits before the
+        epoch weigh less than their count and later ones more. Entries
+        without a timestamp count as visits made now. Naive timestamps are
+        taken as UTC.
+        """
+        df = pd.DataFrame(history_data)
+        now = pd.Timestamp.now(tz='UTC')
+        if 'timestamp' in df.columns:
+            try:
+                timestamps = pd.to_datetime(df['timestamp'], format='ISO8601', utc=True)
+            except (TypeError, ValueError):
+                # Payloads mixing layouts are parsed element by element
+                timestamps = pd.to_datetime(df['timestamp'], format='mixed', utc=True)
+            timestamps = timestamps.fillna(now)
+        else:
+            timestamps = pd.Series(now, index=df.index)
+        
+        # One vectorized exponent for all rows, relative to the epoch
+        days = (timestamps - epoch) / pd.Timedelta(days=1)
+        df['weighted_count'] = df['count'] * np.exp(DECAY_RATE * days.to_numpy(dtype=float))
+        return df
+    
+    def _rebase(self):
+        """
+        Move the epoch to now, scaling every stored weight by the decay
+        accumulated since the previous epoch. Shares no arrays with the
+        model it was copied from.
+        """
+        now = pd.Timestamp.now(tz='UTC')
+        factor = self.decay_factor(now)
+        matrix = self.user_tag_matrix.copy()
+        matrix.data *= factor
+        self.user_tag_matrix = matrix
+        self.user_norms = self.user_norms * factor
+        self.epoch = now
+    
+    def decay_factor(self, at=None):
+        """
+        Return the factor turning stored weights into weights at time `at`
+        (default now). Similarities and per-user category shares do not
+        depend on it, so recommendations never need a retrain to stay current.
+        """
+        at = pd.Timestamp.now(tz='UTC') if at is None else at
+        return float(np.exp(-DECAY_RATE * ((at - self.epoch) / pd.Timedelta(days=1))))
+    
+    def get_user_rows(self, user_ids):
+        """
+        Look up matrix rows for many users at once
+        
+        Returns:
+            np.ndarray: Row of each user, -1 for users not in the model
+        """
+        user_ids = np.asarray(user_ids, dtype=str)
+        if len(self.users) == 0:
+            return np.full(len(user_ids), -1)
+        positions = np.searchsorted(self.users, user_ids, sorter=self.user_order)
+        rows = self.user_order[np.minimum(positions, len(self.users) - 1)]
+        return np.where(self.users[rows] == user_ids, rows, -1)
+    
+    def get_user_row(self, user_id):
+        """Return the matrix row of a user, or None if the user is unknown"""
+        if self.users is None:
+            return None
+        row = self.get_user_rows([user_id])[0]
+        return int(row) if row >= 0 else None
+    
+    @staticmethod
+    def _row_norms(matrix):
+        return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    
+    @staticmethod
+    def _similarity_rows(rows, normalized, normalized_t):
+        """Cosine similarity of the users at `rows` against every user"""
+        return normalized[rows].toarray() @ normalized_t
+    
+    def _similarity_operands(self):
+        """
+        Return the row-normalized user-tag matrix and its transpose in float32
+        
+        Rows are normalized in float64 before the cast: the raw decayed
+        weights of visits from a few years back are below float32 range.
+        """
+        inverse_norms = np.zeros(len(self.user_norms))
+        np.divide(1, self.user_norms, out=inverse_norms, where=self.user_norms > 0)
+        normalized = (sparse.diags(inverse_norms) @ self.user_tag_matrix).tocsr().astype(np.float32)
+        return normalized, normalized.T.tocsc()
+    
+    def _build_neighbors(self):
+        """
+        Compute the top-k cosine neighbors of every user, one block of rows
+        at a time so memory stays O(block x users) instead of users x users.
+        Rows are padded with index -1 when a user has fewer than k users with
+        positive similarity.
+        """
+        n_users = self.user_tag_matrix.shape[0]
+        k = max(0, min(self.n_neighbors, n_users - 1))
+        indices = np.full((n_users, k), -1, dtype=np.int32)
+        scores = np.zeros((n_users, k), dtype=np.float32)
+        if k == 0:
+            return indices, scores
+        
+        normalized, normalized_t = self._similarity_operands()
+        block_rows = max(1, SIMILARITY_BLOCK_ELEMENTS // n_users)
+        for start in range(0, n_users, block_rows):
+            rows = np.arange(start, min(start + block_rows, n_users))
+            similarity = self._similarity_rows(rows, normalized, normalized_t)
+            similarity[np.arange(len(rows)), rows] = -np.inf
+            indices[rows], scores[rows] = _top_k(similarity, k)
+        return indices, scores
+    
+    def _update_neighbors(self, changed, n_new_users):
+        """
+        Refresh neighbor lists after the rows of `changed` users were updated.
+        
+        Only similarities involving changed users moved, so the lists that
+        need a full recompute are those of the changed users and of users
+        that had a changed user as neighbor. Every other list can only gain
+        changed users, which are merged in from the similarity rows computed
+        anyway. The result matches a full rebuild at O(affected x users)
+        instead of O(users^2).
+        """
+        k = self.neighbor_indices.shape[1]
+        n_users = len(self.users)
+        indices = np.vstack([self.neighbor_indices, np.full((n_new_users, k), -1, dtype=np.int32)])
+        scores = np.vstack([self.neighbor_scores, np.zeros((n_new_users, k), dtype=np.float32)])
+        if k == 0:
+            return indices, scores
+        
+        is_changed = np.zeros(n_users, dtype=bool)
+        is_changed[changed] = True
+        had_changed_neighbor = ((indices >= 0) & is_changed[np.maximum(indices, 0)]).any(axis=1)
+        is_recomputed = is_changed | had_changed_neighbor
+        # Changed users first, so their similarities are merged as early as possible
+        recompute = np.concatenate([changed, np.flatnonzero(had_changed_neighbor & ~is_changed)])
+        
+        normalized, normalized_t = self._similarity_operands()
+        block_rows = max(1, SIMILARITY_BLOCK_ELEMENTS // n_users)
+        for start in range(0, len(recompute), block_rows):
+            rows = recompute[start:start + block_rows]
+            similarity = self._similarity_rows(rows, normalized, normalized_t)
+            similarity[np.arange(len(rows)), rows] = -np.inf
+            indices[rows], scores[rows] = _top_k(similarity, k)
+            
+            # Other lists only change if a changed user now beats their k-th
+            # neighbor, or has positive similarity while the list has room
+            sources = is_changed[rows]
+            if not sources.any():
+                continue
+            rows, similarity = rows[sources], similarity[sources]
+            threshold = np.where(indices[:, -1] >= 0, scores[:, -1], 0)
+            targets = np.flatnonzero(~is_recomputed & (similarity > threshold[None, :]).any(axis=0))
+            if len(targets) == 0:
+                continue
+            candidate_ids = np.hstack([indices[targets], np.broadcast_to(rows, (len(targets), len(rows)))])
+            candidate_scores = np.hstack([
+                np.where(indices[targets] >= 0, scores[targets], -np.inf), similarity[:, targets].T
+            ])
+            indices[targets], scores[targets] = _top_k(candidate_scores, k, candidate_ids)
+        return indices, scores
+    
+    def _build_tag_indexes(self):
+        """Derive the tag lookup map and per-tag vectors from the tags"""
+        self.tag_index = {tag: i for i, tag in enumerate(self.tags)}
+        self.tag_categories = np.array([category_mapping.get(tag, 'other') for tag in self.tags], dtype=object)
+        self.tag_category_codes, self.category_names = pd.factorize(self.tag_categories)
+        self.recommendable_tags = np.array([tag in all_possible_tags for tag in self.tags], dtype=bool)
+    
+    def has_user(self, user_id):
+        """Return True if the user is part of the trained model"""
+        return self.get_user_row(user_id) is not None
+    
+    def get_category_weights(self, row):
+        """
+        Return the weight per category of the user at `row`, summed from the
+        user's matrix row. Values are at the epoch scale; their shares are
+        what the recommender uses.
+        """
+        start, stop = self.user_tag_matrix.indptr[row], self.user_tag_matrix.indptr[row + 1]
+        codes = self.tag_category_codes[self.user_tag_matrix.indices[start:stop]]
+        totals = np.bincount(codes, weights=self.user_tag_matrix.data[start:stop], minlength=len(self.category_names))
+        return {self.category_names[code]: totals[code] for code in np.unique(codes)}
+    
+    def get_user_tag_columns(self, row):
+        """Return the matrix columns of the tags in the history of the user at `row`"""
+        return self.user_tag_matrix.indices[self.user_tag_matrix.indptr[row]:self.user_tag_matrix.indptr[row + 1]]
+    
+    def score_neighbor_tags(self, row):
+        """
+        Aggregate the neighbors of a user per tag
+        
+        Returns:
+            tuple: (similarity_sum, neighbor_count) arrays over all tags, where
+            similarity_sum adds the similarity of every neighbor that has the
+            tag and neighbor_count counts those neighbors
+        """
+        valid = self.neighbor_indices[row] >= 0
+        neighbors = self.neighbor_indices[row][valid]
+        similarities = self.neighbor_scores[row][valid].astype(float)
+        neighbor_rows = self.user_tag_matrix[neighbors]
+        entry_similarity = np.repeat(similarities, np.diff(neighbor_rows.indptr))
+        n_tags = len(self.tags)
+        similarity_sum = np.bincount(neighbor_rows.indices, weights=entry_similarity, minlength=n_tags)
+        neighbor_count = np.bincount(neighbor_rows.indices, minlength=n_tags)
+        return similarity_sum, neighbor_count
+    
+    def get_tag_popularity(self):
+        """Return total weighted count per tag as of now, most popular first"""
+        totals = np.asarray(self.user_tag_matrix.sum(axis=0)).ravel() * self.decay_factor()
+        return pd.Series(totals, index=self.tags).sort_values(ascending=False)
+    
+    def _model_arrays(self):
+        matrix = self.user_tag_matrix
+        return {
+            'users': self.users,
+            'user_order': self.user_order,
+            'tags': self.tags,
+            'matrix_data': matrix.data,
+            'matrix_indices': matrix.indices,
+            'matrix_indptr': matrix.indptr,
+            'user_norms': self.user_norms,
+            'neighbor_indices': self.neighbor_indices,
+            'neighbor_scores': self.neighbor_scores
+        }
+    
+    def save_model(self, filepath=RECOMMENDATION_MODEL_PATH):
+        """
+        Save the trained model to disk as a directory holding one .npy file
+        per array and a header.json describing them
+        
+        Arrays are written under a new generation name first and header.json
+        is replaced last, so a concurrent load sees either the previous or
+        the new model. Files of older generations are removed afterwards;
+        processes that mapped them keep their pages until they reload, and
+        a file that cannot be removed is retried on the next save.
+        """
+        try:
+            os.makedirs(filepath, exist_ok=True)
+            generation = f"{time.time_ns():x}"
+            files = {}
+            for name, array in self._model_arrays().items():
+                files[name] = f"{name}.{generation}.npy"
+                np.save(os.path.join(filepath, files[name]), np.ascontiguousarray(array), allow_pickle=False)
+            
+            header = {
+                'format_version': MODEL_FORMAT_VERSION,
+                'generation': generation,
+                'n_neighbors': self.n_neighbors,
+                'shape': list(self.user_tag_matrix.shape),
+                'epoch': self.epoch.isoformat(),
+                'last_training_time': self.last_training_time.isoformat(),
+                'history_id': self.history_id,
+                'arrays': files
             }
-            joblib.dump(model_data, filepath)
-            return True
+            header_tmp = os.path.join(filepath, f"header.json.{generation}.tmp")
+            with open(header_tmp, 'w') as f:
+                json.dump(header, f, indent=2)
+            os.replace(header_tmp, os.path.join(filepath, 'header.json'))
+            
+            self.generation = generation
         except Exception as e:
             print(f"Error saving model: {str(e)}")
             return False
+        
+        self._remove_old_generations(filepath, generation)
+        return True
     
-    def load_model(self, filepath='recommendation_model.pkl'):
-        """Load the trained model from disk"""
+    @staticmethod
+    def _remove_old_generations(filepath, generation):
+        """
+        Remove the array files of generations older than `generation`
+        
+        The new header is already live, so this is best effort: a file that
+        cannot be removed yet (mapped by another process on Windows, say) is
+        left for the next save to try again. Only older generations are
+        removed, so a save racing this one from another process keeps its
+        files.
+        """
+        for name in os.listdir(filepath):
+            parts = name.split('.')
+            if len(parts) == 3 and parts[2] == 'npy' and int(parts[1], 16) < int(generation, 16):
+                try:
+                    os.remove(os.path.join(filepath, name))
+                except OSError as e:
+                    print(f"Could not remove old model file {name}: {str(e)}")
+    
+    def load_model(self, filepath=RECOMMENDATION_MODEL_PATH, mmap=True):
+        """
+        Load a trained model from disk
+        
+        Returns False without reporting an error when nothing is saved at
+        `filepath`.
+        
+        Parameters:
+            filepath (str): Model directory written by save_model, or a pickle
+                file from older versions
+            mmap (bool): Memory-map the arrays read-only instead of reading
+                them, so processes loading the same files share their pages
+        """
+        if not os.path.exists(filepath):
+            return False
         try:
-            model_data = joblib.load(filepath)
-            self.user_similarity = model_data['user_similarity']
-            self.user_tag_matrix = model_data['user_tag_matrix']
-            self.df = model_data['df']
-            self.last_training_time = model_data['last_training_time']
-            self.category_weights = model_data['category_weights']
+            if not os.path.isdir(filepath):
+                return self._load_pickle(filepath)
+            
+            # A save may remove the files of the header we just read, in
+            # which case the new header is read again
+            for attempt in range(3):
+                with open(os.path.join(filepath, 'header.json')) as f:
+                    header = json.load(f)
+                if header['format_version'] != MODEL_FORMAT_VERSION:
+                    raise ValueError(f"Unsupported model format version {header['format_version']}")
+                try:
+                    arrays = {
+                        name: np.load(os.path.join(filepath, file), mmap_mode='r' if mmap else None, allow_pickle=False)
+                        for name, file in header['arrays'].items()
+                    }
+                    break
+                except FileNotFoundError:
+                    if attempt == 2:
+                        raise
+            
+            self.n_neighbors = header['n_neighbors']
+            self.user_tag_matrix = sparse.csr_matrix(
+                (arrays['matrix_data'], arrays['matrix_indices'], arrays['matrix_indptr']),
+                shape=tuple(header['shape'])
+            )
+            self.users = arrays['users']
+            self.user_order = arrays['user_order']
+            self.tags = arrays['tags']
+            self._build_tag_indexes()
+            self.user_norms = arrays['user_norms']
+            self.neighbor_indices = arrays['neighbor_indices']
+            self.neighbor_scores = arrays['neighbor_scores']
+            self.epoch = pd.Timestamp(header['epoch'])
+            self.last_training_time = pd.Timestamp(header['last_training_time'])
+            self.generation = header['generation']
+            self.history_id = header.get('history_id')
             return True
         except Exception as e:
             print(f"Error loading model: {str(e)}")
             return False
+    
+    @staticmethod
+    def read_generation(filepath=RECOMMENDATION_MODEL_PATH):
+        """Return the generation of the model saved at `filepath`, or None"""
+        try:
+            with open(os.path.join(filepath, 'header.json')) as f:
+                return json.load(f)['generation']
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _load_pickle(self, filepath):
+        """Load a model saved by earlier versions with joblib"""
+        model_data = joblib.load(filepath)
+        if 'neighbor_indices' not in model_data:
+            # Files from before the sparse format hold a dense similarity
+            # matrix; rebuild from the stored history instead
+            return self.train(model_data['df'][['user', 'tag', 'count'] + (
+                ['timestamp'] if 'timestamp' in model_data['df'].columns else []
+            )])
+        self.n_neighbors = model_data['n_neighbors']
+        self.user_tag_matrix = model_data['user_tag_matrix']
+        self.users = np.asarray(model_data['users'], dtype=str)
+        self.user_order = np.argsort(self.users, kind='stable')
+        self.tags = np.asarray(model_data['tags'], dtype=str)
+        self._build_tag_indexes()
+        self.user_norms = self._row_norms(self.user_tag_matrix)
+        self.neighbor_indices = model_data['neighbor_indices']
+        self.neighbor_scores = model_data['neighbor_scores']
+        self.last_training_time = model_data['last_training_time']
+        # Weights saved before epochs were stored were decayed as of training
+        self.epoch = model_data.get('epoch') or self.last_training_time.tz_localize('UTC')
+        return True
 
 # Initialize the recommendation model
-recommendation_model = RecommendationModel()
-try:
-    recommendation_model.load_model()
-except:
-    print("No existing model found. Will train on first request.")
+recommendation_model = RecommendationModel(
+    n_neighbors=int(os.environ.get('RECOMMENDATION_NEIGHBORS', '50'))
+)
+
+# Server-side visit history, fed by /ingest_history. The model is trained from
+# it at startup or on /retrain_model, and updated with the entries it does
+# not hold yet.
+history_store = HistoryStore(os.environ.get('HISTORY_DB_PATH', HISTORY_DB_PATH))
+if not (recommendation_model.load_model() or recommendation_model.load_model(LEGACY_MODEL_PATH)):
+    if history_store.count() > 0:
+        print("No existing model found. Training from the history store.")
+        recommendation_model.train(history_store.load())
+    else:
+        print("No existing model or history found. Ingest history and call /retrain_model.")
+
+# Serializes incremental updates; readers never take it
+model_update_lock = threading.Lock()
+
+# Identity of the saved header.json last checked by sync_recommendation_model,
+# and when it last checked
+_synced_header = None
+_last_sync = 0.0
 
-def recommend_tags_for_user(history_data, user_id, top_n=6):
+@contextmanager
+def model_write_lock():
+    """
+    Serialize changes to the recommendation model within this process and,
+    with SHARED_MODELS, across all workers. The latest saved generation is
+    loaded first so changes are applied on top of it.
+    """
+    with model_update_lock:
+        if not SHARED_MODELS:
+            yield
+            return
+        with file_lock(RECOMMENDATION_MODEL_PATH + '.lock'):
+            _load_saved_generation()
+            yield
+
+def _load_saved_generation():
+    # Called with model_update_lock held
+    global recommendation_model
+    generation = RecommendationModel.read_generation()
+    if generation is None or generation == recommendation_model.generation:
+        return
+    model = RecommendationModel(recommendation_model.n_neighbors)
+    if model.load_model():
+        recommendation_model = model
+        print(f"Loaded recommendation model generation {generation}")
+
+def sync_recommendation_model():
+    """
+    Pick up a model saved by another worker and the history entries other
+    workers ingested since. Checks at most every SHARED_SYNC_INTERVAL
+    seconds, and not at all while a change is being made in this process.
+    """
+    global _synced_header, _last_sync
+    if not SHARED_MODELS or time.monotonic() - _last_sync < SHARED_SYNC_INTERVAL:
+        return
+    if not model_update_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sync = time.monotonic()
+        try:
+            info = os.stat(os.path.join(RECOMMENDATION_MODEL_PATH, 'header.json'))
+            header = (info.st_ino, info.st_mtime_ns)
+        except OSError:
+            header = None
+        if header is not None and header != _synced_header:
+            _load_saved_generation()
+            _synced_header = header
+        _apply_stored_history()
+    finally:
+        model_update_lock.release()
+
+def _shared_save_due():
+    # Called with model_write_lock held
+    try:
+        saved = os.stat(os.path.join(RECOMMENDATION_MODEL_PATH, 'header.json')).st_mtime
+    except OSError:
+        return True
+    return time.time() - saved >= SHARED_SAVE_INTERVAL
+
+def publish_recommendation_model(model, save=False):
+    """
+    Make `model` the one served, with a single reference assignment. With
+    SHARED_MODELS and `save`, it is saved first and served memory-mapped
+    from the saved files, so all workers share its pages; call with
+    model_write_lock held then.
+    """
+    global recommendation_model
+    if SHARED_MODELS and save:
+        if not model.save_model():
+            return False
+        saved = RecommendationModel(model.n_neighbors)
+        if saved.load_model():
+            model = saved
+    recommendation_model = model
+    return True
+
+def _apply_history(history, save=False):
+    # Called with model_update_lock held. Publishes the updated model with a
+    # single reference assignment; True if the model holds the entries.
+    updated = recommendation_model.update(history)
+    if updated is None:
+        return False
+    if updated is recommendation_model:
+        return True
+    return publish_recommendation_model(updated, save)
+
+def _apply_stored_history(save=False):
+    # Called with model_update_lock held. Applies the entries stored after
+    # the served model's history_id, e.g. by other workers. An empty model
+    # takes the whole store.
+    history_id = recommendation_model.history_id
+    if history_id is None:
+        if recommendation_model.user_tag_matrix is not None:
+            return True
+        history_id = 0
+    if history_store.last_id() <= history_id:
+        return True
+    return _apply_history(history_store.load(after_id=history_id), save)
+
+# Updates are not saved on every ingest, so the saved model may lack the
+# latest stored entries
+with model_update_lock:
+    _apply_stored_history()
+
+def ingest_recommendation_history(entries, update_model=True, backfill=False):
+    """
+    Append entries to the history store and apply them to the recommendation
+    model
+    
+    The append and the update happen under the model write lock, so models
+    see store ids in order and the history_id check is enough to keep a
+    retrain that caught up on the store from applying entries twice. Entries
+    stored since the model's last update, by other workers or with
+    update_model false, are applied along with them. With SHARED_MODELS the
+    result is saved for the other workers at most every SHARED_SAVE_INTERVAL
+    seconds.
+    
+    Parameters:
+        entries (list): History entries with user, tag and optional count and
+            timestamp
+        update_model (bool): Apply the entries to the model now; otherwise
+            they are applied with the next update or retrain
+        backfill (bool): Counts are cumulative totals per user and tag, e.g.
+            from the backend's user records, and only the part the store
+            does not hold yet is appended
+    
+    Returns:
+        tuple: (entries as stored, True if the model holds them)
+    """
+    append = history_store.backfill if backfill else history_store.append
+    if not update_model:
+        return append(entries), False
+    with model_write_lock():
+        ingested = append(entries)
+        save = SHARED_MODELS and _shared_save_due()
+        if recommendation_model.history_id is None and recommendation_model.user_tag_matrix is not None:
+            # A model trained without store ids, e.g. from posted history,
+            # cannot tell which stored entries it holds
+            return ingested, ingested.empty or _apply_history(ingested, save)
+        return ingested, _apply_stored_history(save)
+
+# Retrains run here, one at a time, off the request threads. Shared models
+# keep job status next to the model so any worker can report it.
+retrain_jobs = BackgroundJobs(
+    'retrain', state_dir=RECOMMENDATION_MODEL_PATH + '.jobs' if SHARED_MODELS else None
+)
+
+def retrain_recommendation_model(history=None, save_model=True):
+    """
+    Train a new recommendation model off to the side and publish it with a
+    single reference assignment. Requests keep using the current model, and
+    history updates are only held up for the final publish.
+    
+    Parameters:
+        history (list, optional): History entries to train on. Defaults to
+            the history store; entries ingested while training are then
+            applied to the new model before it is published.
+        save_model (bool): Save the model to disk. Shared models are always
+            saved since that is how workers get them.
+    
+    Returns:
+        dict: Training time, size and generation of the published model
+    """
+    last_id = None
+    if history is None:
+        last_id = history_store.last_id()
+        history = history_store.load(through_id=last_id)
+        if history.empty:
+            raise ValueError('No history data available')
+    
+    model = RecommendationModel(recommendation_model.n_neighbors)
+    if not model.train(history):
+        raise RuntimeError('Error retraining model')
+    
+    with model_write_lock():
+        if last_id is not None:
+            ingested = history_store.load(after_id=last_id)
+            if not ingested.empty:
+                model = model.update(ingested)
+                if model is None:
+                    raise RuntimeError('Error applying history ingested during retraining')
+        if save_model and not SHARED_MODELS and not model.save_model():
+            raise RuntimeError('Error saving model')
+        if not publish_recommendation_model(model, save=True):
+            raise RuntimeError('Error publishing model')
+        published = recommendation_model
+    
+    return {
+        'last_training_time': str(published.last_training_time),
+        'users': int(published.user_tag_matrix.shape[0]),
+        'tags': int(published.user_tag_matrix.shape[1]),
+        'generation': published.generation
+    }
+
+def fallback_recommendations(top_n):
+    """Low-confidence recommendations used when no model is available"""
+    return [{'tag': tag, 'confidence': 0.2, 'reason': 'Fallback recommendation'} 
+            for tag in list(all_possible_tags)[:top_n]]
+
+def recommend_tags_for_user(user_id, top_n=6):
     """
     Recommend tags based on user history and similar users' preferences.
     Returns recommendations with confidence scores and diversity.
     Default to 6 recommendations for better variety.
     """
+    # Read the published model once; updates swap in a new object meanwhile
+    model = recommendation_model
     try:
-        # Use the trained model if available
-        if recommendation_model.user_similarity is not None:
-            user_similarity = recommendation_model.user_similarity
-            df = recommendation_model.df
-            category_weights = recommendation_model.category_weights
-        else:
-            # Train model if not available
-            recommendation_model.train(history_data)
-            user_similarity = recommendation_model.user_similarity
-            df = recommendation_model.df
-            category_weights = recommendation_model.category_weights
+        if model.user_tag_matrix is None:
+            return fallback_recommendations(top_n)
+        tags_in_history = set(model.tags)
         
-        tags_in_history = set(df["tag"].unique())
-        
-        if user_id not in user_similarity.index:
+        user_row = model.get_user_row(user_id)
+        if user_row is None:
             # Enhanced cold-start handling
-            popular_tags = df.groupby('tag')['weighted_count'].sum().sort_values(ascending=False)
+            popular_tags = model.get_tag_popularity()
             
             # Ensure category diversity
             recommendations = []
@@ -199,48 +1005,48 @@ def recommend_tags_for_user(history_data, user_id, top_n=6):
             return recommendations
         
         # Get user's preferred categories
-        user_categories = category_weights.get(user_id, {})
+        user_categories = model.get_category_weights(user_row)
         total_weight = sum(user_categories.values()) if user_categories else 1
         normalized_category_weights = {k: v/total_weight for k, v in user_categories.items()}
         
-        # Calculate recommendations with category boost
-        similar_users = user_similarity[user_id].drop(user_id).sort_values(ascending=False)
-        user_tags = set(df[df['user'] == user_id]['tag'])
+        # Score every tag at once from the user's nearest neighbors: similarity
+        # sums times a per-tag category boost
+        category_boost = np.array([
+            normalized_category_weights.get(category, 0.1) for category in model.tag_categories
+        ])
+        similarity_sum, similar_users = model.score_neighbor_tags(user_row)
+        raw_scores = similarity_sum * (1 + category_boost)
+        confidences = np.minimum(
+            1.0, raw_scores / np.maximum(similar_users, 1) * (1 + category_boost)
+        )
         
-        recommendations = {tag: {'score': 0, 'similar_users': 0} for tag in all_possible_tags}
+        # Only unvisited, recommendable tags that some neighbor has are candidates
+        candidates = model.recommendable_tags & (similar_users > 0)
+        candidates[model.get_user_tag_columns(user_row)] = False
+        candidate_columns = np.flatnonzero(candidates)
         
-        for similar_user in similar_users.index:
-            similar_user_tags = set(df[df['user'] == similar_user]['tag'])
-            similarity_score = user_similarity[user_id][similar_user]
-            
-            for tag in all_possible_tags:
-                if tag not in user_tags:
-                    category = category_mapping.get(tag, 'other')
-                    category_boost = normalized_category_weights.get(category, 0.1)
-                    
-                    if tag in similar_user_tags:
-                        recommendations[tag]['score'] += similarity_score * (1 + category_boost)
-                        recommendations[tag]['similar_users'] += 1
-        
-        # Calculate confidence scores and add diversity
-        scored_recommendations = []
-        used_categories = set()
+        # The diversity pass below only needs the overall top_n plus the best
+        # tag of each category, so keep those instead of sorting every tag
+        if len(candidate_columns) > top_n:
+            top = np.argpartition(-raw_scores[candidate_columns], top_n - 1)[:top_n]
+            category_codes = model.tag_category_codes[candidate_columns]
+            category_best = np.full(category_codes.max() + 1, -np.inf)
+            np.maximum.at(category_best, category_codes, raw_scores[candidate_columns])
+            best_in_category = raw_scores[candidate_columns] == category_best[category_codes]
+            keep = np.zeros(len(candidate_columns), dtype=bool)
+            keep[top] = True
+            candidate_columns = candidate_columns[keep | best_in_category]
+        candidate_columns = candidate_columns[np.argsort(-raw_scores[candidate_columns], kind='stable')]
         
-        for tag, data in recommendations.items():
-            if data['similar_users'] > 0:
-                category = category_mapping.get(tag, 'other')
-                confidence = min(1.0, (data['score'] / data['similar_users']) * 
-                               (1 + normalized_category_weights.get(category, 0.1)))
-                
-                scored_recommendations.append({
-                    'tag': tag,
-                    'confidence': float(confidence),
-                    'category': category,
-                    'raw_score': data['score']
-                })
+        scored_recommendations = [{
+            'tag': model.tags[column],
+            'confidence': float(confidences[column]),
+            'category': model.tag_categories[column],
+            'raw_score': raw_scores[column]
+        } for column in candidate_columns]
         
-        # Sort by score but ensure category diversity
-        scored_recommendations.sort(key=lambda x: x['raw_score'], reverse=True)
+        # Ensure category diversity over the score-ordered candidates
+        used_categories = set()
         diverse_recommendations = []
         
         # First pass: select highest scoring items from different categories
@@ -273,8 +1079,7 @@ def recommend_tags_for_user(history_data, user_id, top_n=6):
     except Exception as e:
         print(f"Error in recommendation engine: {str(e)}")
         # Fallback recommendations with low confidence
-        return [{'tag': tag, 'confidence': 0.2, 'reason': 'Fallback recommendation'} 
-                for tag in list(all_possible_tags)[:top_n]]
+        return fallback_recommendations(top_n)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -283,6 +1088,37 @@ def home():
     """
     return "Welcome to the UPI classification model!"
 
+def classify_message(message):
+    """
+    Classify a single message, reusing the result of an earlier message with
+    the same classifier input when there is one
+    
+    Parameters:
+        message (str): Input SMS text
+    
+    Returns:
+        dict: Prediction with is_upi, upi_probability, sender and details
+    """
+    sender = extract_sender(message)
+    # The classifier only sees the letters of the message and the sender, so
+    # messages differing in numbers alone get the same prediction. Names are
+    # part of its input: a skeleton, which masks them, is not enough.
+    key = (preprocess_text(message), int(encode_senders(label_encoder, [sender])[0]))
+    cached = classification_cache.get(key)
+    if cached is not None:
+        return dict(cached, sender=sender)
+    
+    if micro_batch_window > 0 and not request_profiler.is_profiling():
+        prediction_result = classification_batcher.submit(message)
+    else:
+        prediction_result = predict_upi_message(model, label_encoder, message)
+    classification_cache.put(key, {
+        'is_upi': prediction_result['is_upi'],
+        'upi_probability': prediction_result['upi_probability'],
+        'details': prediction_result['details']
+    })
+    return prediction_result
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """
@@ -297,9 +1133,7 @@ def predict():
         if not message:
             return jsonify({'error': 'No message provided'}), 400
 
-        # Use the predict_upi_message function from model.py
-        from model import predict_upi_message
-        prediction_result = predict_upi_message(model, label_encoder, message)
+        prediction_result = classify_message(message)
 
         return jsonify({
             'is_upi': prediction_result['is_upi'],
@@ -311,6 +1145,95 @@ def predict():
         print(e)
         return jsonify({'error': str(e)}), 400
 
+def validate_batch(data):
+    """
+    Validate a batch payload of the form {"messages": [...]}
+    
+    Returns:
+        tuple: (messages, valid_indices, errors, error_response). errors maps
+        the index of each unusable item to an error message. error_response is
+        set when the batch as a whole must be rejected.
+    """
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return None, None, None, (jsonify({'error': 'No messages provided'}), 400)
+    if len(messages) > MAX_BATCH_SIZE:
+        return None, None, None, (jsonify({
+            'error': f'Batch too large: {len(messages)} messages (max {MAX_BATCH_SIZE})'
+        }), 413)
+    
+    valid_indices = []
+    errors = {}
+    for i, message in enumerate(messages):
+        if not isinstance(message, str) or not message.strip():
+            errors[i] = 'No message provided'
+        else:
+            valid_indices.append(i)
+    return messages, valid_indices, errors, None
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Endpoint to classify many messages in one request
+    Expects a JSON payload with a 'messages' list
+    Returns one result per message in input order; invalid items get an 'error'
+    """
+    try:
+        data = request.get_json(force=True)
+        messages, valid_indices, errors, error_response = validate_batch(data)
+        if error_response:
+            return error_response
+        
+        predictions = predict_upi_messages(
+            model, label_encoder, [messages[i] for i in valid_indices]
+        )
+        
+        results = [{'error': errors[i]} if i in errors else None for i in range(len(messages))]
+        for i, prediction_result in zip(valid_indices, predictions):
+            results[i] = {
+                'is_upi': prediction_result['is_upi'],
+                'confidence': str(prediction_result['upi_probability']),
+                'sender': prediction_result['sender'],
+                'details': prediction_result['details']
+            }
+        
+        return jsonify({'results': results})
+    except Exception as e:
+        print(e)
+        return jsonify({'error': str(e)}), 400
+
+def extract_message_details(message):
+    """
+    Extract details from a single message. Messages whose template skeleton
+    was seen before with a rule based result are answered from the cached
+    field offsets.
+    
+    Parameters:
+        message (str): Input SMS text
+    
+    Returns:
+        dict: Extracted details, as returned by predict_details
+    """
+    skeleton, slots = fingerprint(message)
+    # A reloaded extraction bundle may answer differently, so key by its hash too
+    key = (skeleton, extraction_registry.get_info()['sha256'])
+    mapping = extraction_cache.get(key)
+    if mapping is not None:
+        return apply_fields(mapping, slots)
+    
+    if micro_batch_window > 0 and not request_profiler.is_profiling():
+        details = extraction_batcher.submit(message)
+    else:
+        details = message_extractor.predict_details(message)
+    # Only fast path results (those with a confidence) are read off the
+    # message text; model predictions may change with the masked recipient,
+    # account or amount, so the models run for every such message
+    if 'error' not in details and 'confidence' in details:
+        mapping = map_fields(message, slots, details)
+        if mapping is not None:
+            extraction_cache.put(key, mapping)
+    return details
+
 @app.route('/extract_details', methods=['POST'])
 def extract_details():
     """
@@ -327,42 +1250,101 @@ def extract_details():
             return jsonify({'error': 'No message provided'}), 400
 
         # Extract details using the UPIMessageExtractor
-        details = message_extractor.predict_details(message)
+        details = extract_message_details(message)
         
         return jsonify(details)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
-@app.route('/recommend_tags', methods=['POST'])
-def get_tag_recommendations():
+@app.route('/extract_details_batch', methods=['POST'])
+def extract_details_batch():
     """
-    Endpoint to get tag recommendations based on user history
+    Endpoint to extract details from many UPI messages in one request
+    Expects a JSON payload with a 'messages' list
+    Returns one result per message in input order; invalid items get an 'error'
+    """
+    try:
+        data = request.get_json(force=True)
+        messages, valid_indices, errors, error_response = validate_batch(data)
+        if error_response:
+            return error_response
+        
+        details = message_extractor.predict_details_batch([messages[i] for i in valid_indices])
+        
+        results = [{'error': errors[i]} if i in errors else None for i in range(len(messages))]
+        for i, item in zip(valid_indices, details):
+            results[i] = item
+        
+        return jsonify({'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/ingest_history', methods=['POST'])
+def ingest_history():
+    """
+    Endpoint to append visit history to the server-side history store
     Expects a JSON payload with:
     {
-        "user_id": "string",
         "history": [
             {
                 "user": "string",
                 "tag": "string",
-                "count": number
+                "count": number (optional, defaults to 1),
+                "timestamp": "ISO 8601 string" (optional, defaults to now)
             }
         ],
+        "update_model": boolean (optional, defaults to true),
+        "backfill": boolean (optional, defaults to false)
+    }
+    The entries are applied to the recommendation model incrementally unless
+    update_model is false; /retrain_model rebuilds it from the whole store.
+    With backfill, counts are totals per user and tag and only what the store
+    is missing is appended, so seeding from the backend can be repeated.
+    """
+    try:
+        data = request.get_json(force=True)
+        history = data.get('history', [])
+        
+        if not isinstance(history, list) or not history:
+            return jsonify({'error': 'No history data provided'}), 400
+        
+        update_model = data.get('update_model', True)
+        backfill = data.get('backfill', False)
+        
+        ingested, model_updated = ingest_recommendation_history(history, update_model, backfill)
+        
+        return jsonify({
+            'status': 'success',
+            'ingested': len(ingested),
+            'model_updated': model_updated
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/recommend_tags', methods=['POST'])
+def get_tag_recommendations():
+    """
+    Endpoint to get tag recommendations for a user from the trained model
+    Expects a JSON payload with:
+    {
+        "user_id": "string",
         "top_n": number (optional, defaults to 6)
     }
+    A "history" list is still accepted for older clients but ignored; send
+    history to /ingest_history instead.
     """
     try:
         data = request.get_json(force=True)
         user_id = data.get('user_id')
-        history = data.get('history', [])
         top_n = data.get('top_n', 6)  # Changed default to 6
         
         if not user_id:
             return jsonify({'error': 'No user_id provided'}), 400
-            
-        if not history:
-            return jsonify({'error': 'No history data provided'}), 400
-            
-        recommendations = recommend_tags_for_user(history, user_id, top_n)
+        
+        sync_recommendation_model()
+        with time_stage('recommendation_scoring'):
+            recommendations = recommend_tags_for_user(user_id, top_n)
         
         return jsonify({
             'user_id': user_id,
@@ -375,7 +1357,7 @@ def get_tag_recommendations():
 @app.route('/retrain_model', methods=['POST'])
 def retrain_model():
     """
-    Endpoint to retrain the recommendation model with new history data
+    Endpoint to retrain the recommendation model
     Expects a JSON payload with:
     {
         "history": [
@@ -384,33 +1366,113 @@ def retrain_model():
                 "tag": "string",
                 "count": number
             }
-        ],
+        ] (optional, defaults to the ingested history store),
         "save_model": boolean (optional)
     }
+    Training runs in the background. Responds 202 with a job_id; poll
+    /retrain_jobs/<job_id> for its status.
     """
     try:
         data = request.get_json(force=True)
-        history = data.get('history', [])
+        history = data.get('history') or None
         save_model = data.get('save_model', True)
         
-        if not history:
+        if history is None and history_store.count() == 0:
             return jsonify({'error': 'No history data provided'}), 400
         
-        # Train the model with new data
-        success = recommendation_model.train(history)
-        
-        if success and save_model:
-            recommendation_model.save_model()
+        job_id = retrain_jobs.submit(retrain_recommendation_model, history, save_model)
         
         return jsonify({
-            'status': 'success' if success else 'error',
-            'message': 'Model retrained successfully' if success else 'Error retraining model',
-            'last_training_time': str(recommendation_model.last_training_time)
-        })
+            'status': 'accepted',
+            'job_id': job_id,
+            'status_url': f'/retrain_jobs/{job_id}'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/retrain_jobs/<job_id>', methods=['GET'])
+def retrain_job_status(job_id):
+    """
+    Endpoint reporting a retrain job: status (queued, running, succeeded or
+    failed), timestamps, and the new model's details or the error
+    """
+    job = retrain_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """
+    Endpoint reporting serving statistics, such as how often extraction is
+    answered by the template fast path versus the models, the hit rates of
+    the template caches and the batches formed by the micro-batchers
+    """
+    return jsonify({
+        'extraction': message_extractor.get_cascade_stats(),
+        'template_cache': {
+            'classification': classification_cache.get_stats(),
+            'extraction': extraction_cache.get_stats()
+        },
+        'micro_batching': {
+            'classification': classification_batcher.get_stats(),
+            'extraction': extraction_batcher.get_stats()
+        },
+        'recommendation_model': {
+            'shared': SHARED_MODELS,
+            'generation': recommendation_model.generation,
+            'history_id': recommendation_model.history_id,
+            'worker_pid': os.getpid()
+        }
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Endpoint exposing request counts, error counts and latency histograms per
+    route and per processing stage, in the Prometheus text format
+    """
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """
+    Endpoint to profile live requests, enabled by setting PROFILING_TOKEN and
+    sending it in the X-Profiling-Token header
+    POST starts a window with a JSON payload:
+    {
+        "requests": number (optional),
+        "seconds": number (optional, at least one of the two),
+        "route": "route pattern such as /predict" (optional),
+        "mode": "cprofile" or "sample" (optional, defaults to cprofile)
+    }
+    GET returns the results per route, as pstats text or collapsed stacks
+    (optional query parameters sort and limit for pstats); DELETE ends the
+    window.
+    """
+    if not PROFILING_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Profiling-Token', ''), PROFILING_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        if request.method == 'POST':
+            data = request.get_json(force=True)
+            request_profiler.arm(
+                requests=data.get('requests'),
+                seconds=data.get('seconds'),
+                route=data.get('route'),
+                mode=data.get('mode', 'cprofile')
+            )
+        elif request.method == 'DELETE':
+            request_profiler.disarm()
+        return jsonify(request_profiler.get_results(
+            sort=request.args.get('sort', 'cumulative'),
+            limit=int(request.args.get('limit', '40'))
+        ))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'}), 200
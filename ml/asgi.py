@@ -0,0 +1,266 @@
+"""
+ASGI entry point for the ML API
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Serves the same routes as app.py. The event loop only reads request bodies
+and writes responses; each request is handled by the Flask app on a bounded
+thread pool, so JSON decoding and inference never block the loop. Every
+route has its own concurrency limit and waiting queue. When both are full,
+or a request waits longer than ASGI_QUEUE_TIMEOUT, the request is answered
+with 503 and a Retry-After header instead of piling up.
+
+Latency-sensitive routes run on the inference pool. Batch, ingest and
+retrain requests run on a separate, smaller pool, so a burst of them cannot
+take threads away from /predict.
+"""
+import asyncio
+import collections
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+logger = logging.getLogger('asgi')
+
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', str(os.cpu_count() or 4)))
+BULK_THREADS = int(os.environ.get('BULK_THREADS', '2'))
+
+# Seconds a request may wait for its route's limit before it is rejected,
+# and the Retry-After sent with 503 responses
+QUEUE_TIMEOUT = float(os.environ.get('ASGI_QUEUE_TIMEOUT', '2'))
+RETRY_AFTER = int(os.environ.get('ASGI_RETRY_AFTER', '1'))
+
+# Per route, keyed by the first path segment: (pool, requests running at
+# once, requests allowed to wait). 'inline' routes are cheap and answered on
+# the event loop.
+ROUTE_LIMITS = {
+    '/predict': ('inference', INFERENCE_THREADS, 8 * INFERENCE_THREADS),
+    '/extract_details': ('inference', INFERENCE_THREADS, 8 * INFERENCE_THREADS),
+    '/recommend_tags': ('inference', INFERENCE_THREADS, 8 * INFERENCE_THREADS),
+    '/predict_batch': ('bulk', BULK_THREADS, 4),
+    '/extract_details_batch': ('bulk', BULK_THREADS, 4),
+    '/ingest_history': ('bulk', BULK_THREADS, 16),
+    '/retrain_model': ('bulk', 1, 0),
+    '/retrain_jobs': ('inline', None, None),
+    '/health': ('inline', None, None),
+    '/stats': ('inline', None, None),
+    '/metrics': ('inline', None, None),
+    '/admin': ('inline', None, None),
+    '/': ('inline', None, None),
+}
+DEFAULT_LIMIT = ('bulk', 1, 4)
+
+
+class RouteGate:
+    """Concurrency limit with a bounded waiting queue for one route"""
+
+    def __init__(self, limit, queue_size):
+        """
+        Parameters:
+            limit (int): Requests allowed to run at once
+            queue_size (int): Requests allowed to wait for a free slot
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.rejected = 0
+        self._waiters = collections.deque()
+
+    @property
+    def waiting(self):
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def acquire(self, timeout):
+        """
+        Take a slot, waiting in line for at most `timeout` seconds
+
+        Returns:
+            bool: False if the queue is full or the wait timed out
+        """
+        # Counters change without yielding to the loop, so a burst of
+        # requests sees the slots taken by the ones before it
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return True
+        if self.waiting >= self.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Hand the slot to the oldest waiting request, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def get_stats(self):
+        """Return the limit, queue size and current counters"""
+        return {
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'active': self.active,
+            'waiting': self.waiting,
+            'rejected': self.rejected
+        }
+
+
+def build_environ(scope, body):
+    """Build the WSGI environ for an ASGI http scope and its request body"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    """Run the Flask app for one request and return (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return lambda data: None
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+class MLApplication:
+    """ASGI application serving the Flask routes with admission control"""
+
+    def __init__(self, route_limits=None, default_limit=DEFAULT_LIMIT):
+        """
+        Parameters:
+            route_limits (dict, optional): Path to (pool, limit, queue size).
+                Defaults to ROUTE_LIMITS.
+            default_limit (tuple): Limits for paths not listed
+        """
+        self.route_limits = ROUTE_LIMITS if route_limits is None else route_limits
+        self.default_limit = default_limit
+        self.pools = {
+            'inference': ThreadPoolExecutor(INFERENCE_THREADS, thread_name_prefix='inference'),
+            'bulk': ThreadPoolExecutor(BULK_THREADS, thread_name_prefix='bulk'),
+        }
+        # Gates are only used from the event loop, so they need no locking
+        self._gates = {}
+
+    def _limits(self, route):
+        return self.route_limits.get(route, self.default_limit)
+
+    def _gate(self, route):
+        gate = self._gates.get(route)
+        if gate is None:
+            _, limit, queue_size = self._limits(route)
+            gate = self._gates[route] = RouteGate(limit, queue_size)
+        return gate
+
+    def get_stats(self):
+        """Return the gate counters of every route seen so far"""
+        return {path: gate.get_stats() for path, gate in self._gates.items()}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in self.pools.values():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        environ = build_environ(scope, bytes(body))
+
+        route = '/' + scope['path'].split('/')[1]
+        pool = self._limits(route)[0]
+        if pool == 'inline':
+            await self._respond(send, *call_wsgi(environ))
+            return
+
+        gate = self._gate(route)
+        if not await gate.acquire(QUEUE_TIMEOUT):
+            await self._respond(send, 503, [
+                (b'content-type', b'application/json'),
+                (b'retry-after', str(RETRY_AFTER).encode())
+            ], json.dumps({'error': 'Server busy, retry later'}).encode())
+            return
+        try:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.pools[pool], call_wsgi, environ)
+        except Exception as e:
+            logger.error(f"Error handling {scope['path']}: {str(e)}")
+            response = (500, [(b'content-type', b'application/json')],
+                        json.dumps({'error': str(e)}).encode())
+        finally:
+            gate.release()
+        await self._respond(send, *response)
+
+    @staticmethod
+    async def _respond(send, status, headers, body):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+application = MLApplication()
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+logger = logging.getLogger('background_jobs')
+
+
+class BackgroundJobs:
+    """
+    Runs long tasks such as retraining off the request thread and keeps
+    their status for polling.
+
+    Jobs run one at a time, in submission order, on a single worker thread,
+    so two retrains never build models concurrently. The most recent
+    `history_size` jobs are kept. With a state_dir, job status is also
+    written there so any server process sharing the directory can answer
+    a status request.
+    """
+
+    def __init__(self, name='jobs', history_size=100, state_dir=None):
+        """
+        Parameters:
+            name (str): Name used for the worker thread and in logs
+            history_size (int): Number of finished jobs kept for polling
+            state_dir (str, optional): Directory for job status files
+        """
+        self.name = name
+        self.history_size = history_size
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) and return the id of the new job
+
+        The job succeeds with fn's return value as its result, or fails with
+        the message of the exception fn raised.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            # Created on first use so forked server workers get their own
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix=self.name)
+            job = self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'submitted_at': self._now(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._write(job)
+            while len(self._jobs) > self.history_size:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]['status'] in ('queued', 'running'):
+                    break
+                del self._jobs[oldest]
+                if self.state_dir:
+                    try:
+                        os.remove(self._state_path(oldest))
+                    except OSError:
+                        pass
+            self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._set(job_id, status='running', started_at=self._now())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"{self.name} job {job_id} failed: {str(e)}")
+            self._set(job_id, status='failed', error=str(e), finished_at=self._now())
+            return
+        self._set(job_id, status='succeeded', result=result, finished_at=self._now())
+
+    def _set(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id] = dict(self._jobs[job_id], **fields)
+            self._write(job)
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f'{job_id}.json')
+
+    def _write(self, job):
+        if not self.state_dir:
+            return
+        # Replace the file in one step so readers never see half a status
+        path = self._state_path(job['job_id'])
+        try:
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(job, f, default=str)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.error(f"Failed to write status of {self.name} job {job['job_id']}: {str(e)}")
+
+    @staticmethod
+    def _now():
+        return pd.Timestamp.now(tz='UTC').isoformat()
+
+    def get(self, job_id):
+        """Return a copy of the job's status, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.state_dir and all(c in '0123456789abcdef' for c in job_id):
+            try:
+                with open(self._state_path(job_id)) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return None
+
+    def list(self):
+        """Return the status of the jobs submitted to this process, newest first"""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
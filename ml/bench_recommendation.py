@@ -0,0 +1,229 @@
+"""
+Benchmark RecommendationModel training and recommend_tags_for_user latency
+on synthetic history of growing size.
+
+Usage:
+    python bench_recommendation.py [--rows 10000 100000 1000000] [--users N]
+                                   [--legacy-max-rows N] [--repeat R]
+                                   [--queries Q]
+
+History rows are drawn at random over --users users, the tags in
+all_possible_tags and the last year of timestamps. Training time includes
+the blocked top-k neighbor search, so raise --users to see it scale.
+The previous row-wise implementation is timed too, up to --legacy-max-rows,
+and its category weights are checked against the vectorized ones.
+
+With --queries, recommendation latency is then measured for Q random users
+(only a few for the slowest method)
+on the largest history that still fits the legacy limit, comparing the
+matrix scoring against the per-neighbor loop it replaced (whose output must
+match) and the original DataFrame filtering over a dense similarity matrix.
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+import app
+from app import RecommendationModel, all_possible_tags, category_mapping
+
+
+def make_history(rows, users, seed=0):
+    """Build `rows` synthetic history entries as the /retrain_model payload would"""
+    rng = np.random.default_rng(seed)
+    tags = sorted(all_possible_tags)
+    now = pd.Timestamp.now()
+    ages = pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    frame = pd.DataFrame({
+        'user': np.char.add('user_', rng.integers(0, users, rows).astype(str)),
+        'tag': np.asarray(tags)[rng.integers(0, len(tags), rows)],
+        'count': rng.integers(1, 10, rows),
+        'timestamp': (now - ages).strftime('%Y-%m-%dT%H:%M:%S')
+    })
+    return frame.to_dict('records')
+
+
+def legacy_train(history_data):
+    """The row-wise training steps replaced by the vectorized version"""
+    df = pd.DataFrame(history_data)
+    df['time_weight'] = df['timestamp'].apply(
+        lambda x: np.exp(-0.1 * (pd.Timestamp.now() - pd.Timestamp(x)).days)
+    )
+    df['weighted_count'] = df['count'] * df['time_weight']
+    user_tag_matrix = df.pivot_table(
+        index='user', columns='tag', values='weighted_count', aggfunc='sum', fill_value=0
+    )
+    category_weights = {}
+    for user in user_tag_matrix.index:
+        user_tags = df[df['user'] == user]
+        category_counts = {}
+        for _, row in user_tags.iterrows():
+            category = category_mapping.get(row['tag'], 'other')
+            category_counts[category] = category_counts.get(category, 0) + row['weighted_count']
+        category_weights[user] = category_counts
+    return category_weights
+
+
+def diversify(scored, top_n):
+    """The unchanged diversity pass shared by the legacy recommenders"""
+    scored.sort(key=lambda x: x['raw_score'], reverse=True)
+    result = []
+    used_categories = set()
+    for rec in scored:
+        if len(result) >= top_n:
+            break
+        if rec['category'] not in used_categories:
+            result.append({'tag': rec['tag'], 'confidence': rec['confidence'],
+                           'reason': f"Based on similar users' preferences in {rec['category']}"})
+            used_categories.add(rec['category'])
+    for rec in scored:
+        if len(result) >= top_n:
+            break
+        if not any(d['tag'] == rec['tag'] for d in result):
+            result.append({'tag': rec['tag'], 'confidence': rec['confidence'],
+                           'reason': f"Highly recommended place in {rec['category']}"})
+    return result
+
+
+def score_loop(user_id, neighbors, tags_of, category_weights, top_n):
+    """Per-neighbor, per-tag scoring loop of the legacy recommenders"""
+    user_categories = category_weights.get(user_id, {})
+    total_weight = sum(user_categories.values()) if user_categories else 1
+    weights = {k: v / total_weight for k, v in user_categories.items()}
+    user_tags = tags_of(user_id)
+    recommendations = {tag: {'score': 0, 'similar_users': 0} for tag in all_possible_tags}
+    for similar_user, similarity_score in neighbors:
+        similar_user_tags = tags_of(similar_user)
+        for tag in all_possible_tags:
+            if tag not in user_tags:
+                category_boost = weights.get(category_mapping.get(tag, 'other'), 0.1)
+                if tag in similar_user_tags:
+                    recommendations[tag]['score'] += similarity_score * (1 + category_boost)
+                    recommendations[tag]['similar_users'] += 1
+    scored = []
+    for tag, data in recommendations.items():
+        if data['similar_users'] > 0:
+            category = category_mapping.get(tag, 'other')
+            confidence = min(1.0, (data['score'] / data['similar_users']) * (1 + weights.get(category, 0.1)))
+            scored.append({'tag': tag, 'confidence': float(confidence), 'category': category,
+                           'raw_score': data['score']})
+    return diversify(scored, top_n)
+
+
+def neighbor_loop_recommend(model, user_id, top_n):
+    """Loop over the precomputed neighbors, as before the matrix scoring"""
+    matrix = model.user_tag_matrix
+
+    def tags_of(row):
+        return set(model.tags[matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]])
+
+    row = model.get_user_row(user_id)
+    valid = model.neighbor_indices[row] >= 0
+    neighbors = zip(model.neighbor_indices[row][valid], model.neighbor_scores[row][valid].astype(float))
+    # Rows stand in for user ids here
+    category_weights = {row: model.get_category_weights(row)}
+    return score_loop(row, neighbors, tags_of, category_weights, top_n)
+
+
+def dataframe_recommend(df, user_similarity, category_weights, user_id, top_n):
+    """The original recommender: DataFrame filtering over all other users"""
+    similar_users = user_similarity[user_id].drop(user_id).sort_values(ascending=False)
+    neighbors = ((u, user_similarity[user_id][u]) for u in similar_users.index)
+    return score_loop(user_id, neighbors, lambda u: set(df[df['user'] == u]['tag']), category_weights, top_n)
+
+
+def bench_latency(history, queries, repeat):
+    model = RecommendationModel()
+    model.train(history)
+    df = pd.DataFrame(history)
+    app.recommendation_model = model
+    user_similarity = pd.DataFrame(cosine_similarity(model.user_tag_matrix), index=model.users, columns=model.users)
+    category_weights = {user: model.get_category_weights(row) for row, user in enumerate(model.users)}
+    rng = np.random.default_rng(1)
+    user_ids = [model.users[i] for i in rng.integers(0, len(model.users), queries)]
+
+    # The DataFrame loop takes seconds per query, so it only gets a few
+    runs = [
+        ('matrix scoring', queries, lambda u: app.recommend_tags_for_user(u, 6)),
+        ('neighbor loop', queries, lambda u: neighbor_loop_recommend(model, u, 6)),
+        ('dataframe loop', min(queries, 3),
+         lambda u: dataframe_recommend(df, user_similarity, category_weights, u, 6)),
+    ]
+    print(f"\nrecommend_tags_for_user, {len(history)} rows, {len(model.users)} users")
+    print(f"{'method':<16}{'queries':>8}{'ms/query':>12}{'queries/s':>12}")
+    results = {}
+    for name, count, fn in runs:
+        seconds, results[name] = best_of(lambda: [fn(u) for u in user_ids[:count]], repeat)
+        print(f"{name:<16}{count:>8}{1000 * seconds / count:>12.3f}{count / seconds:>12.0f}")
+
+    # The loops walk a set, so tags with tied scores come out in hash order
+    mismatches = tie_order = 0
+    for a, b in zip(results['matrix scoring'], results['neighbor loop']):
+        confidences = [r['confidence'] for r in a], [r['confidence'] for r in b]
+        if len(a) != len(b) or not np.allclose(*confidences):
+            mismatches += 1
+        elif [r['tag'] for r in a] != [r['tag'] for r in b]:
+            tie_order += 1
+    print(f"matrix scoring vs neighbor loop: {mismatches} of {queries} responses differ, "
+          f"{tie_order} only in the order of tied tags")
+
+
+def same_weights(expected, actual):
+    # The legacy code decays by whole days of age, the model by exact age
+    # from its epoch, which is a few seconds after the history was generated
+    if expected.keys() != actual.keys():
+        return False
+    for user, categories in expected.items():
+        if categories.keys() != actual[user].keys():
+            return False
+        if not np.allclose(list(categories.values()), [actual[user][c] for c in categories], rtol=1e-3):
+            return False
+    return True
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--legacy-max-rows', type=int, default=100_000,
+                        help="Skip the row-wise implementation above this size")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--queries', type=int, default=200,
+                        help="Recommendation queries for the latency comparison, 0 to skip")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'users':>8}{'train s':>12}{'legacy s':>12}{'speedup':>10}  weights")
+    for rows in args.rows:
+        history = make_history(rows, args.users)
+        model = RecommendationModel()
+        seconds, ok = best_of(lambda: model.train(history), args.repeat)
+        if not ok:
+            raise SystemExit(f"Training failed at {rows} rows")
+
+        legacy = speedup = check = '-'
+        if rows <= args.legacy_max_rows:
+            legacy_seconds, weights = best_of(lambda: legacy_train(history), args.repeat)
+            legacy = f"{legacy_seconds:.3f}"
+            speedup = f"{legacy_seconds / seconds:.1f}x"
+            actual = {user: model.get_category_weights(row) for row, user in enumerate(model.users)}
+            check = 'match' if same_weights(weights, actual) else 'DIFFER'
+        print(f"{rows:>10}{model.user_tag_matrix.shape[0]:>8}{seconds:>12.3f}{legacy:>12}{speedup:>10}  {check}")
+
+    latency_rows = [rows for rows in args.rows if rows <= args.legacy_max_rows]
+    if args.queries > 0 and latency_rows:
+        bench_latency(make_history(max(latency_rows), args.users), args.queries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark TagRecommendationModel.fit against the nested-loop co-occurrence
+build it replaced.
+
+Usage:
+    python bench_tag_cooccurrence.py [--visits 10000 100000 1000000]
+                                     [--per-user 10 100 1000] [--tags T]
+                                     [--legacy-max-pairs N] [--repeat R]
+
+For every combination of total visits and visits per user, synthetic visits
+are drawn over --tags tags and fit is timed. The legacy loop does one step
+per pair of visits by the same user, so it is only run while that number of
+pairs stays under --legacy-max-pairs; its normalized matrix and tag counts
+are checked against the sparse build.
+"""
+import argparse
+import logging
+import time
+from collections import defaultdict
+import numpy as np
+
+from IndividualHistory import TagRecommendationModel, logger
+
+
+def make_visits(visits, per_user, tags, seed=0):
+    """Build `visits` visit records, `per_user` for each user"""
+    rng = np.random.default_rng(seed)
+    users = np.arange(visits) // per_user
+    # Skewed tag popularity, as in real visit logs
+    weights = 1.0 / np.arange(1, len(tags) + 1)
+    chosen = rng.choice(len(tags), size=visits, p=weights / weights.sum())
+    return [{"user": f"user_{user}", "tag": tags[tag]} for user, tag in zip(users, chosen)]
+
+
+def legacy_fit(tag_list, visited_log):
+    """The per-user nested loop replaced by the sparse X^T X build"""
+    tag_to_idx = {tag: idx for idx, tag in enumerate(tag_list)}
+    cooccurrence_matrix = np.zeros((len(tag_list), len(tag_list)))
+    tag_counts = {tag: 0 for tag in tag_list}
+    user_visits = defaultdict(list)
+    for visit in visited_log:
+        user_visits[visit["user"]].append(visit["tag"])
+    for user, tags in user_visits.items():
+        for tag1 in tags:
+            if tag1 not in tag_to_idx:
+                continue
+            idx1 = tag_to_idx[tag1]
+            tag_counts[tag1] += 1
+            for tag2 in tags:
+                if tag2 not in tag_to_idx:
+                    continue
+                cooccurrence_matrix[idx1, tag_to_idx[tag2]] += 1
+    for i in range(len(tag_list)):
+        if tag_counts[tag_list[i]] > 0:
+            cooccurrence_matrix[i, :] /= tag_counts[tag_list[i]]
+    return cooccurrence_matrix, tag_counts
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--visits', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--per-user', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--legacy-max-pairs', type=int, default=20_000_000,
+                        help="Skip the nested loop above this many visit pairs")
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    tags = [f"tag_{i}" for i in range(args.tags)]
+    print(f"{'visits':>10}{'per user':>10}{'pairs':>14}{'fit s':>10}{'legacy s':>10}{'speedup':>10}  check")
+    for visits in args.visits:
+        for per_user in args.per_user:
+            visit_log = make_visits(visits, per_user, tags)
+            model = TagRecommendationModel(set(tags))
+            seconds, _ = best_of(lambda: model.fit(visit_log), args.repeat)
+
+            pairs = visits * per_user
+            legacy = speedup = check = '-'
+            if pairs <= args.legacy_max_pairs:
+                legacy_seconds, (matrix, counts) = best_of(lambda: legacy_fit(model.tag_list, visit_log), args.repeat)
+                legacy = f"{legacy_seconds:.3f}"
+                speedup = f"{legacy_seconds / seconds:.0f}x"
+                same = np.allclose(matrix, model.cooccurrence_matrix) and counts == model.tag_counts
+                check = 'match' if same else 'DIFFER'
+            print(f"{visits:>10}{per_user:>10}{pairs:>14}{seconds:>10.3f}{legacy:>10}{speedup:>10}  {check}")
+
+
+if __name__ == "__main__":
+    main()
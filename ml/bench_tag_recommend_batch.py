@@ -0,0 +1,84 @@
+"""
+Benchmark TagRecommendationModel.recommend_batch against calling recommend
+once per user.
+
+Usage:
+    python bench_tag_recommend_batch.py [--users 1000 10000 100000]
+                                        [--tags T] [--history H] [--top-n N]
+                                        [--loop-max-users U] [--repeat R]
+
+A model is fit on synthetic visits over --tags tags, then each user gets a
+history of up to --history tags with visit counts. The per-user loop is
+only timed up to --loop-max-users users; where it runs, its
+recommendations are checked against the batch ones, as sets since tags
+with equal scores may be ordered differently.
+"""
+import argparse
+import logging
+import time
+import numpy as np
+
+from IndividualHistory import TagRecommendationModel, logger
+
+
+def make_histories(users, history, tags, seed=0):
+    """Build one history of up to `history` distinct tags per user"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(tags) + 1)
+    weights /= weights.sum()
+    histories = []
+    for _ in range(users):
+        size = rng.integers(0, history + 1)
+        chosen = rng.choice(len(tags), size=size, replace=False, p=weights)
+        histories.append([{"tag": tags[tag], "count": int(rng.integers(1, 20))} for tag in chosen])
+    return histories
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--history', type=int, default=10)
+    parser.add_argument('--top-n', type=int, default=5)
+    parser.add_argument('--loop-max-users', type=int, default=10_000,
+                        help="Skip the per-user loop above this many users")
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    tags = [f"tag_{i}" for i in range(args.tags)]
+    rng = np.random.default_rng(1)
+    visits = [{"user": f"user_{i // 20}", "tag": tags[tag]}
+              for i, tag in enumerate(rng.integers(0, len(tags), size=200_000))]
+    model = TagRecommendationModel(set(tags)).fit(visits)
+
+    print(f"{'users':>10}{'batch s':>10}{'users/s':>12}{'loop s':>10}{'users/s':>12}{'speedup':>10}  check")
+    for users in args.users:
+        histories = make_histories(users, args.history, tags)
+        seconds, batch = best_of(lambda: model.recommend_batch(histories, args.top_n), args.repeat)
+
+        loop = loop_rate = speedup = check = '-'
+        if users <= args.loop_max_users:
+            loop_seconds, single = best_of(
+                lambda: [model.recommend(history, args.top_n) for history in histories], args.repeat)
+            loop = f"{loop_seconds:.3f}"
+            loop_rate = f"{users / loop_seconds:.0f}"
+            speedup = f"{loop_seconds / seconds:.0f}x"
+            # Tags with equal scores may come out in either order
+            same = sum(set(a) == set(b) for a, b in zip(batch, single))
+            check = 'match' if same == users else f'{users - same} differ'
+        print(f"{users:>10}{seconds:>10.3f}{users / seconds:>12.0f}{loop:>10}{loop_rate:>12}{speedup:>10}  {check}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+import pytest
+
+# app opens its history store and follows saved models on import; keep the
+# tests away from the working copy's files
+os.environ['HISTORY_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='ml-tests-'), 'history.db')
+os.environ['SHARED_MODELS'] = '0'
+
+
+@pytest.fixture
+def app_state(tmp_path, monkeypatch):
+    """The app module with an empty history store and recommendation model"""
+    import app
+    from history_store import HistoryStore
+    monkeypatch.setattr(app, 'history_store', HistoryStore(str(tmp_path / 'history.db')))
+    monkeypatch.setattr(app, 'recommendation_model', app.RecommendationModel())
+    return app
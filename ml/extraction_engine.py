@@ -0,0 +1,103 @@
+import re
+
+# Field patterns in priority order. Each pattern has exactly one named group
+# `v` holding the field value; for every field the first pattern that matches
+# wins, the same way the UPIMessageExtractor helpers try their patterns.
+FIELD_PATTERNS = [
+    ('amount', r'by\s*(?P<v>\d+(?:\.\d{1,2})?)'),
+    ('amount', r'(?:₹|INR|Rs\.?)\s?(?P<v>\d+(?:,\d+)*(?:\.\d{1,2})?)'),
+    ('bank', r'-(?P<v>[\w\s]+)$'),
+    ('bank', r'Your\s+(?P<v>[A-Z]\w*(?: [A-Z]\w*)*)\s+(?i:a/c)'),
+    ('account', r'(?:A/C|a/c|Acct|acct)\s*(?P<v>[Xx\d]*\d)'),
+    ('recipient', r'(?i)(?:trf\s+to|transfer\s+to|payment\s+to)\s*(?P<v>[A-Za-z\s]+)(?=\s*Refno|\s*Ref|\s*Call|-)'),
+    ('recipient', r'(?i)to\s*(?P<v>[A-Za-z\s]+)(?=\s*Refno|\s*Ref|\s*Call|-)'),
+    ('recipient', r'(?:[Tt]rf|[Tt]ransfer|[Pp]ayment|[Pp]aid)\s+to\s+(?P<v>[A-Z][a-z]+(?: [A-Z][a-z]+)*)'),
+    ('vpa', r'(?:VPA|vpa)\s*(?P<v>[\w.\-]+@[\w\-]+(?:\.[\w\-]+)*)'),
+    ('reference_number', r'(?i:ref(?:\s*no)?)\s*[:.]?\s*(?P<v>\d{4,})'),
+    ('date', r'\b(?P<v>\d{1,2}(?:-?[A-Z][a-z]{2}-?|[/-]\d{1,2}[/-])\d{2}(?:\d{2})?)\b'),
+    ('direction', r'(?i)\b(?P<v>debited|credited|paid|sent|received|deducted)\b'),
+]
+
+FIELDS = ['amount', 'bank', 'account', 'recipient', 'vpa', 'reference_number', 'date', 'direction']
+
+DIRECTIONS = {
+    'debited': 'debit',
+    'paid': 'debit',
+    'sent': 'debit',
+    'deducted': 'debit',
+    'credited': 'credit',
+    'received': 'credit',
+}
+
+# Templates like "HDFC UPI: A/C ..." carry the bank at the start instead of the end
+_LEADING_BANK = re.compile(r'(?P<v>[A-Z][\w ]*?)\s+UPI:')
+_RECIPIENT_CLEANUP = re.compile(r'\s*(?:Refno|Ref).*$', re.IGNORECASE)
+
+
+def _compile_patterns():
+    compiled = {field: [] for field in FIELDS}
+    for field, pattern in FIELD_PATTERNS:
+        compiled[field].append(re.compile(pattern, re.MULTILINE))
+    return list(compiled.items())
+
+
+# CPython's regex engine skips ahead fastest on patterns with a literal
+# prefix, so separate precompiled searches beat one big alternation here
+_COMPILED_PATTERNS = _compile_patterns()
+
+
+def _clean_recipient(value):
+    recipient = _RECIPIENT_CLEANUP.sub('', value.strip())
+    return recipient if len(recipient) > 1 else None
+
+
+def _parse_amount(value):
+    try:
+        return float(value.replace(',', ''))
+    except ValueError:
+        return None
+
+
+def extract_fields(message):
+    """
+    Extract all UPI fields from a message in one call
+
+    Args:
+        message (str): Input SMS text
+
+    Returns:
+        dict: amount, bank, account, recipient, vpa, reference_number, date
+        and direction ('debit' or 'credit'). Missing fields are None.
+    """
+    message = str(message)
+    result = {}
+    for field, patterns in _COMPILED_PATTERNS:
+        value = None
+        for pattern in patterns:
+            match = pattern.search(message)
+            if match is None:
+                continue
+            value = match.group('v')
+            if field != 'recipient':
+                break
+            # Like the recipient helper, fall through to the next pattern
+            # when a match cleans up to a single letter
+            value = _clean_recipient(value)
+            if value:
+                break
+        result[field] = value
+
+    if result['recipient'] is None:
+        result['recipient'] = result['vpa']
+    if result['bank'] is None:
+        leading = _LEADING_BANK.match(message)
+        if leading:
+            result['bank'] = leading.group('v')
+    if result['amount'] is not None:
+        result['amount'] = _parse_amount(result['amount'])
+    if result['bank'] is not None:
+        result['bank'] = result['bank'].strip()
+    if result['direction'] is not None:
+        result['direction'] = DIRECTIONS.get(result['direction'].lower())
+    return result
+
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for the ML API
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and the workers are forked from it,
+so the classifier, the label encoder and the extraction bundle are loaded
+once and their memory is shared copy-on-write. The recommendation model is
+memory-mapped from its saved directory, and SHARED_MODELS makes every worker
+follow the generation saved there, so a retrain handled by one worker is
+served by all of them. History updates are saved at most every
+SHARED_SAVE_INTERVAL seconds; in between, workers apply the entries ingested
+by the others from the history store.
+"""
+import gc
+import os
+
+os.environ.setdefault('SHARED_MODELS', '1')
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Move the loaded models out of the collector's generations so that a
+    # collection in a worker does not write to, and so copy, their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads started in the master are not carried over by fork
+    import app
+    if app.reload_interval > 0:
+        app.extraction_registry.start_watcher(app.reload_interval)
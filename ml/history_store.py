@@ -0,0 +1,201 @@
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+logger = logging.getLogger('history_store')
+
+HISTORY_DB_PATH = 'history.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    count REAL NOT NULL DEFAULT 1,
+    timestamp TEXT NOT NULL
+)
+"""
+
+
+def _to_utc(value):
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize('UTC')
+    return timestamp.tz_convert('UTC')
+
+
+def _format_timestamp(timestamp):
+    # One fixed ISO 8601 layout so the whole column parses in a single pass
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+class HistoryStore:
+    """
+    Append-only log of user visit history kept in a SQLite file.
+
+    The recommendation model is trained from this store instead of from
+    request payloads. Every call opens its own connection, so the store can
+    be shared by request threads and by several worker processes; WAL mode
+    lets readers proceed while an ingest is being written.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        """
+        Parameters:
+            path (str): Path of the SQLite database file
+        """
+        self.path = path
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Commit on success, roll back on error, and always close
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def validate(entries):
+        """
+        Normalize history entries to (user, tag, count, timestamp) rows
+
+        Timestamps are stored in UTC, with naive ones taken as UTC. Entries
+        without a timestamp are stamped with the current time.
+
+        Raises:
+            ValueError: If an entry is not an object with user and tag
+        """
+        now = _format_timestamp(pd.Timestamp.now(tz='UTC'))
+        rows = []
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict) or not entry.get('user') or not entry.get('tag'):
+                raise ValueError(f"History entry {i} needs 'user' and 'tag'")
+            try:
+                count = float(entry.get('count', 1))
+                timestamp = _format_timestamp(_to_utc(entry['timestamp'])) if entry.get('timestamp') else now
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"History entry {i} is invalid: {str(e)}")
+            rows.append((str(entry['user']), str(entry['tag']), count, timestamp))
+        return rows
+
+    def append(self, entries):
+        """
+        Append history entries to the store in one transaction
+
+        Parameters:
+            entries (list): History entries with user, tag and optional count
+                and timestamp
+
+        Returns:
+            pd.DataFrame: The entries as written, with their ids, in the
+            layout of load()
+        """
+        rows = self.validate(entries)
+        ids = []
+        if rows:
+            with self._write_lock, self._connect() as conn:
+                conn.executemany(
+                    'INSERT INTO history (user, tag, count, timestamp) VALUES (?, ?, ?, ?)', rows
+                )
+                # The transaction holds the database's write lock, so its
+                # rows got consecutive ids
+                last = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                ids = range(last - len(rows) + 1, last + 1)
+            logger.info("Appended %d history entries", len(rows))
+        return pd.DataFrame(
+            [(entry_id,) + row for entry_id, row in zip(ids, rows)],
+            columns=['id', 'user', 'tag', 'count', 'timestamp']
+        )
+
+    def backfill(self, entries):
+        """
+        Append what the store is missing of cumulative per-user tag counts
+
+        Meant for seeding the store from another system's running totals:
+        for every (user, tag) only the amount above the count already stored
+        is appended, as one entry. Entries for the same user and tag are
+        summed first. Running it again with the same or older totals appends
+        nothing.
+
+        Parameters:
+            entries (list): History entries with user, tag, total count and
+                optional timestamp
+
+        Returns:
+            pd.DataFrame: The entries appended, with their ids, in the layout
+            of load()
+        """
+        totals = {}
+        for user, tag, count, timestamp in self.validate(entries):
+            total, _ = totals.get((user, tag), (0, None))
+            totals[(user, tag)] = (total + count, timestamp)
+
+        rows = []
+        ids = []
+        with self._write_lock, self._connect() as conn:
+            # Hold the write lock across the read, so entries appended by
+            # other processes meanwhile are not counted twice
+            conn.execute('BEGIN IMMEDIATE')
+            users = sorted({user for user, _ in totals})
+            stored = {}
+            for start in range(0, len(users), 500):
+                chunk = users[start:start + 500]
+                stored.update(((user, tag), count) for user, tag, count in conn.execute(
+                    f"SELECT user, tag, SUM(count) FROM history WHERE user IN ({','.join('?' * len(chunk))}) "
+                    "GROUP BY user, tag", chunk
+                ))
+            for (user, tag), (total, timestamp) in totals.items():
+                missing = total - stored.get((user, tag), 0)
+                if missing > 0:
+                    rows.append((user, tag, missing, timestamp))
+            if rows:
+                conn.executemany(
+                    'INSERT INTO history (user, tag, count, timestamp) VALUES (?, ?, ?, ?)', rows
+                )
+                last = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                ids = range(last - len(rows) + 1, last + 1)
+        if rows:
+            logger.info("Backfilled %d history entries", len(rows))
+        return pd.DataFrame(
+            [(entry_id,) + row for entry_id, row in zip(ids, rows)],
+            columns=['id', 'user', 'tag', 'count', 'timestamp']
+        )
+
+    def load(self, after_id=None, through_id=None):
+        """
+        Return stored history as a DataFrame with id, user, tag, count and
+        timestamp
+
+        Parameters:
+            after_id (int, optional): Only entries appended after this id
+            through_id (int, optional): Only entries up to and including this
+                id, e.g. a last_id() taken earlier
+
+        Returns:
+            pd.DataFrame: The entries, in the order they were appended
+        """
+        query = 'SELECT id, user, tag, count, timestamp FROM history WHERE id > ?'
+        params = [after_id or 0]
+        if through_id is not None:
+            query += ' AND id <= ?'
+            params.append(through_id)
+        with self._connect() as conn:
+            return pd.read_sql_query(query + ' ORDER BY id', conn, params=params)
+
+    def last_id(self):
+        """Return the id of the latest stored entry, 0 when the store is empty"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM history').fetchone()[0]
+
+    def count(self):
+        """Return the number of stored history entries"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
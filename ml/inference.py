@@ -0,0 +1,97 @@
+import re
+import joblib
+import numpy as np
+import pandas as pd
+from metrics import time_stage
+
+# Inference-only helpers for the UPI classifier. Kept free of training imports
+# so that serving processes start quickly; training lives in model.py.
+
+CLASSIFIER_MODEL_PATH = 'upi_classifier_model.pkl'
+SENDER_ENCODER_PATH = 'sender_label_encoder.pkl'
+
+def extract_sender(message):
+    """Extract sender from the message"""
+    # Split message and return the first part (sender)
+    sender = message.split(':')[0].strip()
+    return sender
+
+def preprocess_text(text):
+    """Clean text for better vectorization"""
+    text = text.lower()
+    text = re.sub(r'[^a-zA-Z\s]', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def load_classifier(model_path=CLASSIFIER_MODEL_PATH, encoder_path=SENDER_ENCODER_PATH):
+    """Load the trained classifier pipeline and sender label encoder"""
+    return joblib.load(model_path), joblib.load(encoder_path)
+
+def encode_senders(le, senders):
+    """
+    Encode senders with the fitted label encoder, mapping unseen senders to -1
+    
+    Vectorized equivalent of calling le.transform on each sender and catching
+    the ValueError raised for senders that were not in the training data.
+    The extraction models encode banks, accounts and recipients with it too.
+    """
+    senders = np.asarray(senders, dtype=object)
+    classes = le.classes_
+    if len(senders) == 0 or len(classes) == 0:
+        return np.full(len(senders), -1)
+    
+    positions = np.searchsorted(classes, senders)
+    positions = np.clip(positions, 0, len(classes) - 1)
+    known = classes[positions] == senders
+    return np.where(known, positions, -1)
+
+def predict_upi_messages(model, le, messages):
+    """
+    Predict for a batch of messages whether each one is a UPI message
+    
+    Runs one TF-IDF transform and one predict_proba call for the whole batch
+    and derives the predicted label from the probabilities.
+    
+    Parameters:
+        model (Pipeline): Trained UPI classifier pipeline
+        le (LabelEncoder): Fitted sender label encoder
+        messages (list): List of message strings
+    
+    Returns:
+        list: One prediction dict per message, in input order
+    """
+    if len(messages) == 0:
+        return []
+    
+    senders = [extract_sender(message) for message in messages]
+    with time_stage('preprocess_text'):
+        processed = [preprocess_text(message) for message in messages]
+    input_data = pd.DataFrame({
+        'processed_message': processed,
+        'sender_encoded': encode_senders(le, senders)
+    })
+    
+    # Same as model.predict_proba, with the feature and estimator steps timed
+    # separately
+    with time_stage('tfidf_transform'):
+        features = input_data
+        for _, step in model.steps[:-1]:
+            features = step.transform(features)
+    with time_stage('predict_classifier'):
+        proba = model.steps[-1][1].predict_proba(features)
+    labels = model.classes_[np.argmax(proba, axis=1)]
+    max_proba = proba.max(axis=1)
+    
+    results = []
+    for sender, label, probability in zip(senders, labels, max_proba):
+        results.append({
+            'is_upi': bool(label),
+            'upi_probability': probability,
+            'sender': sender,
+            'details': f"Predicted as {'UPI' if label else 'Non-UPI'} message"
+        })
+    return results
+
+def predict_upi_message(model, le, message):
+    """Predict if a message is a UPI message"""
+    return predict_upi_messages(model, le, [message])[0]
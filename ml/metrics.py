@@ -0,0 +1,143 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency histogram bucket bounds in seconds, from sub-millisecond stages to
+# slow batch requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        """Add `amount` to the series with the given label values"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """Histogram with fixed buckets and optional labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """Record one observation for the series with the given label values"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        names = self.labelnames + ('le',)
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {total}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose samples are read from a callback when metrics are rendered"""
+
+    def __init__(self, name, documentation, labelnames, callback):
+        """
+        Parameters:
+            callback (callable): Returns a dict of label value tuples to values
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, callback):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry and the metrics shared by the serving modules
+registry = MetricsRegistry()
+REQUESTS = registry.counter('ml_requests_total', 'Requests handled, by route and status code', ('route', 'status'))
+REQUEST_ERRORS = registry.counter('ml_request_errors_total', 'Requests answered with an error status', ('route',))
+REQUEST_LATENCY = registry.histogram('ml_request_duration_seconds', 'Request latency by route', ('route',))
+STAGE_LATENCY = registry.histogram('ml_stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+
+
+@contextmanager
+def time_stage(stage):
+    """Record the time spent in the with block under `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage)
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger('micro_batcher')
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    """
+    Collects single items submitted by concurrent request threads and runs
+    them through one batch call.
+
+    A worker thread takes the waiting items once max_batch_size of them are
+    queued or the oldest has waited max_wait seconds, calls
+    process_batch(items) and hands each caller its own result. A request
+    arriving alone waits at most max_wait before it is processed.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait=0.002, name='batcher'):
+        """
+        Parameters:
+            process_batch (callable): Takes a list of items and returns a list
+                with one result per item, in the same order
+            max_batch_size (int): Most items processed in one call
+            max_wait (float): Seconds the oldest item may wait for others
+            name (str): Name used for the worker thread and in logs
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = []
+        self._condition = threading.Condition()
+        self._worker = None
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def submit(self, item):
+        """
+        Queue one item and block until its result is ready
+
+        Returns:
+            The result process_batch produced for the item; exceptions raised
+            by process_batch are raised here
+        """
+        future = Future()
+        with self._condition:
+            self._ensure_worker()
+            self._queue.append((item, future, time.perf_counter()))
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._condition.notify()
+        return future.result()
+
+    def _ensure_worker(self):
+        # Started on first use rather than at import, so a server that
+        # forks workers after importing the app starts one in each of them
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name=f'{self.name}-worker')
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            self._record(batch, started)
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"{self.name} returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(batch)} failed: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record(self, batch, started):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if len(batch) <= bound),
+                      len(BATCH_SIZE_BUCKETS))
+        with self._condition:
+            self._batches += 1
+            self._items += len(batch)
+            self._wait_seconds += sum(waits)
+            self._max_wait_seconds = max(self._max_wait_seconds, max(waits))
+            self._histogram[bucket] += 1
+
+    def get_stats(self):
+        """Return queue depth, batch size histogram and added wait time"""
+        with self._condition:
+            labels = [str(bound) for bound in BATCH_SIZE_BUCKETS] + ['+Inf']
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'batches': self._batches,
+                'items': self._items,
+                'mean_batch_size': self._items / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(zip(labels, self._histogram)),
+                'mean_wait_ms': 1000 * self._wait_seconds / self._items if self._items else 0.0,
+                'max_wait_ms_seen': 1000 * self._max_wait_seconds
+            }
@@ -1,5 +1,5 @@
+import argparse
 import pandas as pd
-import numpy as np
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import LabelEncoder
@@ -8,22 +8,29 @@ from sklearn.pipeline import Pipeline
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import joblib
-import re
 
-def extract_sender(message):
-    """Extract sender from the message"""
-    # Split message and return the first part (sender)
-    sender = message.split(':')[0].strip()
-    return sender
+# Inference helpers are re-exported so existing `from model import ...` keeps working
+from inference import (
+    CLASSIFIER_MODEL_PATH,
+    SENDER_ENCODER_PATH,
+    extract_sender,
+    preprocess_text,
+    encode_senders,
+    predict_upi_message,
+    predict_upi_messages,
+)
 
-def preprocess_text(text):
-    """Clean text for better vectorization"""
-    text = text.lower()
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-def train_upi_classifier(csv_path='upi_dataset.csv'):
+def train_upi_classifier(csv_path='upi_dataset.csv', cv_folds=5,
+                         model_path=CLASSIFIER_MODEL_PATH, encoder_path=SENDER_ENCODER_PATH):
+    """
+    Train the UPI classifier and save it with its sender label encoder
+    
+    Parameters:
+        csv_path (str): Labelled dataset with 'message' and 'label' columns
+        cv_folds (int): Number of cross-validation folds, 0 to skip
+        model_path (str): Where to save the trained pipeline
+        encoder_path (str): Where to save the sender label encoder
+    """
     # Load dataset
     df = pd.read_csv(csv_path)
     
@@ -76,58 +83,39 @@ def train_upi_classifier(csv_path='upi_dataset.csv'):
     print(confusion_matrix(y_test, y_pred))
     
     # Perform cross-validation
-    cv_scores = cross_val_score(pipeline, X, y, cv=5)
-    print(f"\nCross-validation Scores: {cv_scores}")
-    print(f"Mean CV Score: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
+    if cv_folds:
+        cv_scores = cross_val_score(pipeline, X, y, cv=cv_folds)
+        print(f"\nCross-validation Scores: {cv_scores}")
+        print(f"Mean CV Score: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
     
     # Save model, vectorizer, and label encoder
-    joblib.dump(pipeline, 'upi_classifier_model.pkl')
-    joblib.dump(le, 'sender_label_encoder.pkl')
+    joblib.dump(pipeline, model_path)
+    joblib.dump(le, encoder_path)
     print("\nModel and Label Encoder saved successfully!")
     
     return pipeline, le
 
-def predict_upi_message(model, le, message):
-    """Predict if a message is a UPI message"""
-    # Extract sender and preprocess message
-    sender = extract_sender(message)
-    processed_msg = preprocess_text(message)
-    
-    # Handle unseen senders by using a default encoding
-    try:
-        sender_encoded = le.transform([sender])[0]
-    except ValueError:
-        # If sender is not in the original training data, use a default value
-        sender_encoded = -1  # or len(le.classes_)
-    
-    # Prepare input
-    input_data = pd.DataFrame({
-        'processed_message': [processed_msg],
-        'sender_encoded': [sender_encoded]
-    })
-    
-    # Predict
-    prediction = model.predict(input_data)
-    proba = model.predict_proba(input_data)
-    
-    return {
-        'is_upi': bool(prediction[0]),
-        'upi_probability': max(proba[0]),
-        'sender': sender,
-        'details': f"Predicted as {'UPI' if prediction[0] else 'Non-UPI'} message"
-    }
-
-# Train the model
-model, label_encoder = train_upi_classifier()
-
-# Example predictions
-test_messages = [
-    "SBI: Your a/c XXXXX1234 credited INR 5000.00 by UPI REF NO 789456 on 15-Feb-25. Bal: INR 50000",
-    "Friend Amit: Hey, what's up? Wanna grab coffee later?",
-    "Netflix: Your monthly subscription is due. Pay now to continue uninterrupted service."
-]
-
-print("\nTest Message Predictions:")
-for msg in test_messages:
-    print(f"\nMessage: {msg}")
-    print(predict_upi_message(model, label_encoder, msg))
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the UPI message classifier")
+    parser.add_argument('--csv', default='upi_dataset.csv', help="Labelled dataset to train on")
+    parser.add_argument('--cv', type=int, default=5, help="Cross-validation folds (0 to skip)")
+    parser.add_argument('--model-path', default=CLASSIFIER_MODEL_PATH)
+    parser.add_argument('--encoder-path', default=SENDER_ENCODER_PATH)
+    args = parser.parse_args()
+    
+    # Train the model
+    model, label_encoder = train_upi_classifier(
+        args.csv, cv_folds=args.cv, model_path=args.model_path, encoder_path=args.encoder_path
+    )
+    
+    # Example predictions
+    test_messages = [
+        "SBI: Your a/c XXXXX1234 credited INR 5000.00 by UPI REF NO 789456 on 15-Feb-25. Bal: INR 50000",
+        "Friend Amit: Hey, what's up? Wanna grab coffee later?",
+        "Netflix: Your monthly subscription is due. Pay now to continue uninterrupted service."
+    ]
+    
+    print("\nTest Message Predictions:")
+    for msg in test_messages:
+        print(f"\nMessage: {msg}")
+        print(predict_upi_message(model, label_encoder, msg))
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+import joblib
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only a single server process is run
+    fcntl = None
+
+logger = logging.getLogger('model_registry')
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for a model file that is loaded once and shared.
+
+    Readers call get() and receive the currently published object. A reload
+    builds the new object off to the side and publishes it with a single
+    reference assignment, so requests never wait on joblib.load once the
+    first load has happened.
+    """
+
+    def __init__(self, path, loader=joblib.load):
+        """
+        Parameters:
+            path (str): Path of the model file
+            loader (callable): Function that deserializes the file
+        """
+        self.path = path
+        self._loader = loader
+        self._model = None
+        self._mtime = None
+        self._digest = None
+        self._load_lock = threading.Lock()
+        self._watcher = None
+        self._stop_event = threading.Event()
+
+    def get(self):
+        """
+        Return the loaded model, loading it on first use.
+
+        Raises FileNotFoundError if the file does not exist yet.
+        """
+        model = self._model
+        if model is not None:
+            return model
+        with self._load_lock:
+            if self._model is None:
+                self._load()
+            return self._model
+
+    def reload(self, force=False):
+        """
+        Reload the file if its modification time or content hash changed.
+
+        Parameters:
+            force (bool): Reload even if the file looks unchanged
+
+        Returns:
+            bool: True if a new model was published
+        """
+        with self._load_lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return False
+            if not force and self._model is not None and mtime == self._mtime:
+                return False
+            digest = self._file_digest()
+            if not force and self._model is not None and digest == self._digest:
+                # Touched but not modified, just remember the new mtime
+                self._mtime = mtime
+                return False
+            self._load(mtime, digest)
+            return True
+
+    def _load(self, mtime=None, digest=None):
+        if mtime is None:
+            mtime = os.path.getmtime(self.path)
+        if digest is None:
+            digest = self._file_digest()
+        model = self._loader(self.path)
+        # Publish with one assignment so concurrent readers see old or new, never a mix
+        self._model = model
+        self._mtime = mtime
+        self._digest = digest
+        logger.info("Loaded %s (sha256 %s)", self.path, digest[:12])
+
+    def _file_digest(self):
+        sha = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def start_watcher(self, interval=30.0):
+        """
+        Start a daemon thread that checks the file every `interval` seconds
+        and hot-reloads it in the background when it changes.
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,))
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """Stop the background watcher thread"""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep serving the previous model if the new file is unreadable
+                logger.error(f"Failed to reload {self.path}: {str(e)}")
+
+    def get_info(self):
+        """Return registry information"""
+        return {
+            'path': self.path,
+            'loaded': self._model is not None,
+            'mtime': self._mtime,
+            'sha256': self._digest
+        }
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path, loader=joblib.load):
+    """Return the process-wide registry for `path`, creating it if needed"""
+    key = os.path.abspath(path)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ModelRegistry(path, loader)
+            _registries[key] = registry
+        return registry
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock on `path` across processes, e.g. while a worker
+    saves a model that the other workers load. The lock file is created if
+    needed. Without fcntl this only yields.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,197 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger('profiling')
+
+MODES = ('cprofile', 'sample')
+
+
+class RequestProfiler:
+    """
+    Opt-in profiler for live requests.
+
+    Once armed, the next `requests` requests, or all requests within
+    `seconds`, optionally only those of one route, are profiled and the
+    results are kept per route. The 'cprofile' mode records deterministic
+    call statistics, reported as pstats text. Only one request is profiled
+    at a time in this mode. The 'sample' mode has a background thread
+    sample the stacks of the profiled request threads every
+    `sample_interval` seconds, reported as collapsed stacks for flame graph
+    tools.
+
+    While disarmed, the cost per request is one attribute check.
+    """
+
+    def __init__(self, sample_interval=0.005):
+        """
+        Parameters:
+            sample_interval (float): Seconds between stack samples
+        """
+        self.sample_interval = sample_interval
+        self.armed = False
+        self.mode = 'cprofile'
+        self.route = None
+        self._remaining = None
+        self._deadline = None
+        self._lock = threading.Lock()
+        self._active = {}
+        self._stats = {}
+        self._stacks = {}
+        self._profiled = Counter()
+        self._reported = True
+        self._sampler = None
+
+    def arm(self, requests=None, seconds=None, route=None, mode='cprofile'):
+        """
+        Start a profiling window, discarding earlier results
+
+        Parameters:
+            requests (int, optional): Number of requests to profile
+            seconds (float, optional): Length of the window; at least one of
+                requests and seconds is required
+            route (str, optional): Only profile this route pattern
+            mode (str): 'cprofile' or 'sample'
+
+        Raises:
+            ValueError: If the window or mode is invalid
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {', '.join(MODES)}")
+        if not requests and not seconds:
+            raise ValueError("Give a number of requests or a number of seconds to profile")
+        with self._lock:
+            self.mode = mode
+            self.route = route
+            self._remaining = int(requests) if requests else None
+            self._deadline = time.monotonic() + float(seconds) if seconds else None
+            self._stats = {}
+            self._stacks = {}
+            self._profiled = Counter()
+            self._reported = False
+            self.armed = True
+            if mode == 'sample' and (self._sampler is None or not self._sampler.is_alive()):
+                self._sampler = threading.Thread(target=self._sample, name='profiling-sampler')
+                self._sampler.daemon = True
+                self._sampler.start()
+        logger.info("Profiling armed: mode=%s requests=%s seconds=%s route=%s", mode, requests, seconds, route)
+
+    def disarm(self):
+        """End the profiling window; requests being profiled still finish"""
+        with self._lock:
+            self.armed = False
+
+    def start(self, route):
+        """
+        Begin profiling the current request if the window claims it
+
+        Returns:
+            object or None: Token to pass to stop(), None if not profiled
+        """
+        with self._lock:
+            if not self.armed:
+                return None
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                self.armed = False
+                return None
+            if self.route is not None and route != self.route:
+                return None
+            if self.mode == 'cprofile' and self._active:
+                return None
+            if self._remaining is not None:
+                self._remaining -= 1
+                if self._remaining <= 0:
+                    self.armed = False
+            ident = threading.get_ident()
+            profile = cProfile.Profile() if self.mode == 'cprofile' else None
+            self._active[ident] = (route, profile)
+        if profile is not None:
+            profile.enable()
+        return ident
+
+    def is_profiling(self):
+        """Return True if the current thread's request is being profiled"""
+        return threading.get_ident() in self._active
+
+    def stop(self, token):
+        """Finish profiling the request started with `token`"""
+        with self._lock:
+            route, profile = self._active.pop(token, (None, None))
+        if route is None:
+            return
+        if profile is not None:
+            profile.disable()
+        with self._lock:
+            self._profiled[route] += 1
+            if profile is not None:
+                if route in self._stats:
+                    self._stats[route].add(profile)
+                else:
+                    self._stats[route] = pstats.Stats(profile)
+            finished = not self.armed and not self._active and not self._reported
+            self._reported = self._reported or finished
+        if finished:
+            # Also log the results, for windows armed at startup that nobody polls
+            for result_route, text in self.get_results()['results'].items():
+                logger.info("Profile of %s:\n%s", result_route, text)
+
+    def _sample(self):
+        while True:
+            time.sleep(self.sample_interval)
+            with self._lock:
+                if not self.armed and not self._active:
+                    self._sampler = None
+                    return
+                active = {ident: route for ident, (route, _) in self._active.items()}
+            frames = sys._current_frames()
+            for ident, route in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack = ';'.join(reversed(names))
+                with self._lock:
+                    self._stacks.setdefault(route, Counter())[stack] += 1
+
+    def get_results(self, sort='cumulative', limit=40):
+        """
+        Return the profiling window's state and its results per route
+
+        Parameters:
+            sort (str): pstats sort key for cprofile results
+            limit (int): Functions listed per route for cprofile results
+
+        Returns:
+            dict: armed, mode, route filter, requests profiled per route, and
+            per route either pstats text or collapsed stack lines
+        """
+        with self._lock:
+            if self.armed and self._deadline is not None and time.monotonic() >= self._deadline:
+                self.armed = False
+            state = {
+                'armed': self.armed,
+                'mode': self.mode,
+                'route': self.route,
+                'remaining_requests': self._remaining,
+                'profiled_requests': dict(self._profiled)
+            }
+            results = {}
+            for route, route_stats in self._stats.items():
+                output = io.StringIO()
+                route_stats.stream = output
+                route_stats.sort_stats(sort).print_stats(limit)
+                results[route] = output.getvalue()
+            for route, counts in self._stacks.items():
+                results[route] = '\n'.join(f"{stack} {count}" for stack, count in counts.most_common())
+        state['results'] = results
+        return state
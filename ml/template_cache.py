@@ -0,0 +1,169 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Variable parts of bank SMS, masked to build a template skeleton. Order
+# matters: VPAs and amounts are claimed before their digits are seen as
+# plain numbers, and names are only taken after transfer keywords.
+_SLOT_PATTERN = re.compile(
+    r'(?P<VPA>[\w.\-]+@[A-Za-z][\w\-]*(?:\.[\w\-]+)*)'
+    r'|(?P<AMT>(?:(?<=₹)|(?<=₹ )|(?<=INR)|(?<=INR )|(?<=Rs\.)|(?<=Rs\. )|(?<=Rs )|(?<=by ))\d[\d,]*(?:\.\d+)?)'
+    r'|(?P<DATE>\b\d{1,2}-?[A-Z][a-z]{2}-?\d{2,4}\b|\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b)'
+    r"|(?P<NAME>(?<=to )(?!(?:VPA|Refno|Ref|Call)\b)[A-Z][\w’'-]*(?: (?!(?:Refno|Ref|Call|on|UPI)\b)[A-Z][\w’'-]*)*)"
+    r'|(?P<NUM>\d+)'
+)
+
+
+def fingerprint(message):
+    """
+    Mask the variable parts of a message into a canonical skeleton
+
+    Parameters:
+        message (str): Input SMS text
+
+    Returns:
+        tuple: (skeleton, slots) where slots is a list of (kind, value, start,
+        end) for every masked span, in message order
+    """
+    message = str(message)
+    slots = []
+    parts = []
+    last = 0
+    for match in _SLOT_PATTERN.finditer(message):
+        kind = match.lastgroup
+        parts.append(message[last:match.start()])
+        parts.append(f'<{kind}>')
+        slots.append((kind, match.group(), match.start(), match.end()))
+        last = match.end()
+    parts.append(message[last:])
+    return ''.join(parts), slots
+
+
+def _slot_number(value):
+    try:
+        return float(value.replace(',', ''))
+    except ValueError:
+        return None
+
+
+def map_fields(message, slots, fields):
+    """
+    Describe how each extracted field was derived from the template slots
+
+    Strings are located in the message: a field covering exactly one slot
+    (plus constant text around it, like the 'X' of 'X1234') is stored as a
+    slot reference, a field entirely inside constant text is stored as is.
+    Numbers must equal the numeric value of exactly one slot, preferring
+    amount slots for the amount; when several slots could have produced a
+    number, the mapping is ambiguous and not cached.
+
+    Returns:
+        dict or None: Field mapping, or None when some field cannot be
+        explained by the skeleton and the result must not be cached
+    """
+    mapping = {}
+    for field, value in fields.items():
+        if isinstance(value, bool) or value is None:
+            mapping[field] = ('const', value)
+        elif isinstance(value, str):
+            start = message.find(value)
+            if start < 0:
+                return None
+            end = start + len(value)
+            inside = [i for i, slot in enumerate(slots) if slot[2] < end and slot[3] > start]
+            if not inside:
+                mapping[field] = ('const', value)
+                continue
+            if len(inside) != 1:
+                return None
+            _, _, slot_start, slot_end = slots[inside[0]]
+            if slot_start < start or slot_end > end:
+                return None
+            mapping[field] = ('slot', inside[0], message[start:slot_start], message[slot_end:end])
+        elif isinstance(value, (int, float)):
+            if field == 'confidence':
+                mapping[field] = ('const', value)
+                continue
+            matches = [i for i, slot in enumerate(slots) if _slot_number(slot[1]) == value]
+            if field == 'amount':
+                # An amount equal to e.g. the account digits must come from
+                # the amount slot
+                matches = [i for i in matches if slots[i][0] == 'AMT'] or matches
+            if len(matches) != 1:
+                return None
+            mapping[field] = ('number', matches[0])
+        else:
+            return None
+    return mapping
+
+
+def apply_fields(mapping, slots):
+    """Rebuild extracted fields for a new message from a cached mapping"""
+    fields = {}
+    for field, rule in mapping.items():
+        if rule[0] == 'const':
+            fields[field] = rule[1]
+        elif rule[0] == 'slot':
+            _, index, prefix, suffix = rule
+            fields[field] = prefix + slots[index][1] + suffix
+        else:
+            fields[field] = round(_slot_number(slots[rule[1]][1]), 2)
+    return fields
+
+
+class TemplateCache:
+    """Bounded, thread-safe LRU keyed by template skeleton or model input"""
+
+    def __init__(self, maxsize=4096):
+        """
+        Parameters:
+            maxsize (int): Maximum number of skeletons kept, 0 disables caching
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value for key, evicting the least recently used entry if full"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """Drop all entries, e.g. after the underlying model changed"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': self._hits / lookups if lookups else 0.0
+            }
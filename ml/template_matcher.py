@@ -0,0 +1,164 @@
+import re
+import threading
+
+from extraction_engine import extract_fields
+
+# Building blocks shared by the bank SMS templates
+_ACCOUNT = r'A/C (?P<account>X\d+)'
+_DIRECTION = r'(?P<direction>debited|credited)'
+_AMOUNT = r'(?P<amount>\d+(?:,\d+)*(?:\.\d{1,2})?)'
+_DATE = r'(?P<date>\d{2}[A-Z][a-z]{2}\d{2})'
+_TRANSFER = r'(?:trf to|transfer to|payment to)'
+_RECIPIENT = r"(?P<recipient>[^\W\d_][\w .'’-]*?)"
+_REFERENCE = r'(?P<reference_number>\d+)'
+_BANK = r'(?P<bank>[A-Za-z][\w ]*?)'
+
+# Known templates, matched against the whole message. These are the formats
+# produced by amount_dataset.UPIDatasetGenerator and seen from every bank.
+DEFAULT_TEMPLATES = [
+    rf'Dear UPI user {_ACCOUNT} {_DIRECTION} by {_AMOUNT} on date {_DATE} {_TRANSFER} {_RECIPIENT} '
+    rf'Refno {_REFERENCE}\. If not u\? call \d+\. -{_BANK}',
+    rf'UPI Alert: {_ACCOUNT} {_DIRECTION} ₹{_AMOUNT} on {_DATE} {_TRANSFER} {_RECIPIENT}\. '
+    rf'Ref {_REFERENCE}\. Call \d+ -{_BANK}',
+    rf'{_BANK} UPI: {_ACCOUNT} {_DIRECTION} ₹{_AMOUNT} on {_DATE} {_TRANSFER} {_RECIPIENT}\. '
+    rf'Ref {_REFERENCE}\. Helpline: \d+',
+    rf'Transaction Alert: {_ACCOUNT} {_DIRECTION} ₹{_AMOUNT} {_TRANSFER} {_RECIPIENT} on {_DATE}\. '
+    rf'Ref No: {_REFERENCE}\. -{_BANK}',
+]
+
+# Fields that must be present for a result to skip the extraction models
+REQUIRED_FIELDS = ('bank', 'account', 'recipient', 'amount')
+
+# Confidence given to a full template match, and the ceiling for results
+# that only come from the generic field extractor
+TEMPLATE_CONFIDENCE = 1.0
+EXTRACTOR_CONFIDENCE = 0.8
+
+_TRAILING_BANK = re.compile(r'-\s*([A-Za-z][\w ]*?)\s*$')
+_LEADING_BANK = re.compile(r'([A-Za-z][\w ]*?) UPI:')
+
+
+class TemplateMatcher:
+    """
+    Rule-first matcher for well-formed bank SMS
+
+    Templates are registered per bank, with '*' holding the ones that apply to
+    every bank. A message is checked against its bank's templates first, then
+    the shared ones; when none match, the generic field extractor is used and
+    the confidence reflects how many required fields it found.
+    """
+
+    def __init__(self, templates=None):
+        """
+        Parameters:
+            templates (dict, optional): Bank name to list of regex strings.
+                Defaults to DEFAULT_TEMPLATES for every bank.
+        """
+        self._templates = {}
+        if templates is None:
+            templates = {'*': DEFAULT_TEMPLATES}
+        for bank, patterns in templates.items():
+            for pattern in patterns:
+                self.add_template(pattern, bank)
+
+    def add_template(self, pattern, bank='*'):
+        """Register a template regex for one bank, or for all banks with '*'"""
+        self._templates.setdefault(bank, []).append(re.compile(pattern))
+
+    def _candidate_templates(self, message):
+        bank_match = _TRAILING_BANK.search(message) or _LEADING_BANK.match(message)
+        if bank_match:
+            for template in self._templates.get(bank_match.group(1), []):
+                yield template
+        for template in self._templates.get('*', []):
+            yield template
+
+    def match(self, message):
+        """
+        Parse a message with the registered templates
+
+        Parameters:
+            message (str): Input SMS text
+
+        Returns:
+            tuple: (fields dict, confidence between 0 and 1)
+        """
+        message = str(message).strip()
+        for template in self._candidate_templates(message):
+            template_match = template.fullmatch(message)
+            if template_match:
+                fields = template_match.groupdict()
+                fields['amount'] = float(fields['amount'].replace(',', ''))
+                return fields, TEMPLATE_CONFIDENCE
+
+        fields = extract_fields(message)
+        found = sum(1 for field in REQUIRED_FIELDS if fields.get(field))
+        return fields, EXTRACTOR_CONFIDENCE * found / len(REQUIRED_FIELDS)
+
+
+class ExtractionCascade:
+    """
+    Decides per message whether rule-based fields are good enough to skip
+    the RandomForest extraction models, and keeps hit-rate counters.
+    """
+
+    def __init__(self, matcher=None, enabled=True, min_confidence=TEMPLATE_CONFIDENCE):
+        """
+        Parameters:
+            matcher (TemplateMatcher, optional): Matcher to use
+            enabled (bool): Whether the fast path is used at all
+            min_confidence (float): Lowest confidence that skips the models
+        """
+        self.matcher = matcher or TemplateMatcher()
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        self._fast_path = 0
+        self._fallback = 0
+        self._lock = threading.Lock()
+
+    def try_fast_path(self, message):
+        """
+        Return the response for a message if the rules are confident enough
+
+        Returns:
+            dict or None: bank, account, recipient, amount and confidence, or
+            None when the message has to go through the models
+        """
+        if not self.enabled:
+            self._record(False)
+            return None
+
+        fields, confidence = self.matcher.match(message)
+        if confidence < self.min_confidence or not all(fields.get(f) for f in REQUIRED_FIELDS):
+            self._record(False)
+            return None
+
+        self._record(True)
+        return {
+            'bank': fields['bank'].strip(),
+            'account': fields['account'],
+            'recipient': fields['recipient'].strip(),
+            'amount': round(fields['amount'], 2),
+            'confidence': confidence
+        }
+
+    def _record(self, fast):
+        with self._lock:
+            if fast:
+                self._fast_path += 1
+            else:
+                self._fallback += 1
+
+    def get_stats(self):
+        """Return fast path and fallback counts and rates"""
+        with self._lock:
+            fast, fallback = self._fast_path, self._fallback
+        total = fast + fallback
+        return {
+            'enabled': self.enabled,
+            'min_confidence': self.min_confidence,
+            'fast_path': fast,
+            'fallback': fallback,
+            'fast_path_rate': fast / total if total else 0.0,
+            'fallback_rate': fallback / total if total else 0.0
+        }
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import asgi
+from asgi import MLApplication, RouteGate
+
+
+def test_gate_admits_up_to_its_limit_then_queues_then_rejects():
+    async def scenario():
+        gate = RouteGate(limit=2, queue_size=1)
+        assert await gate.acquire(1)
+        assert await gate.acquire(1)
+        queued = asyncio.ensure_future(gate.acquire(1))
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        assert not await gate.acquire(1)
+
+        gate.release()
+        assert await queued
+        return gate.get_stats()
+
+    assert asyncio.run(scenario()) == {'limit': 2, 'queue_size': 1, 'active': 2, 'waiting': 0, 'rejected': 1}
+
+
+def test_gate_hands_slots_to_the_oldest_waiter():
+    async def scenario():
+        gate = RouteGate(limit=1, queue_size=3)
+        assert await gate.acquire(1)
+        order = []
+
+        async def wait(name):
+            if await gate.acquire(1):
+                order.append(name)
+
+        waiters = [asyncio.ensure_future(wait(name)) for name in 'abc']
+        await asyncio.sleep(0)
+        for _ in waiters:
+            gate.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiters)
+        return order, gate.active
+
+    assert asyncio.run(scenario()) == (['a', 'b', 'c'], 1)
+
+
+def test_gate_rejects_after_the_timeout_and_frees_the_queue():
+    async def scenario():
+        gate = RouteGate(limit=1, queue_size=1)
+        assert await gate.acquire(1)
+        assert not await gate.acquire(0.01)
+        gate.release()
+        return gate.get_stats()
+
+    assert asyncio.run(scenario()) == {'limit': 1, 'queue_size': 1, 'active': 0, 'waiting': 0, 'rejected': 1}
+
+
+def request(application, path):
+    """Send one GET through the ASGI app and return (status, headers, body)"""
+    async def scenario():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': []}
+        await application(scope, receive, send)
+        return sent
+
+    start, body = asyncio.run(scenario())
+    return start['status'], dict(start['headers']), json.loads(body['body'])
+
+
+def test_full_route_is_answered_with_503(monkeypatch):
+    monkeypatch.setattr(asgi, 'QUEUE_TIMEOUT', 0.01)
+    application = MLApplication({'/health': ('inference', 1, 0)})
+    assert request(application, '/health')[0] == 200
+
+    application._gate('/health').active = 1
+    status, headers, body = request(application, '/health')
+    assert status == 503
+    assert headers[b'retry-after'] == str(asgi.RETRY_AFTER).encode()
+    assert 'error' in body
+    assert application.get_stats()['/health']['rejected'] == 1
+
+
+def test_inline_routes_bypass_the_gates():
+    application = MLApplication({'/health': ('inline', None, None)})
+    status, _, body = request(application, '/health')
+    assert (status, body) == (200, {'status': 'healthy'})
+    assert application.get_stats() == {}
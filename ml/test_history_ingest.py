@@ -0,0 +1,58 @@
+import pytest
+
+
+def model_users(app):
+    return sorted(app.recommendation_model.users.tolist())
+
+
+def user_weights(model, user):
+    """Current decayed weight of each tag a user visited"""
+    row = model.user_tag_matrix[model.get_user_row(user)]
+    return dict(zip(model.tags[row.indices].tolist(), row.data * model.decay_factor()))
+
+
+def test_entries_ingested_without_update_are_applied_later(app_state):
+    app = app_state
+    app.ingest_recommendation_history([{'user': 'a', 'tag': 'Beach'}], update_model=False)
+    app.ingest_recommendation_history([{'user': 'b', 'tag': 'Temple'}], update_model=False)
+    _, updated = app.ingest_recommendation_history([{'user': 'c', 'tag': 'Beach'}])
+
+    assert updated
+    assert model_users(app) == ['a', 'b', 'c']
+    assert app.recommendation_model.history_id == app.history_store.last_id()
+
+
+def test_entries_are_applied_once(app_state):
+    app = app_state
+    app.ingest_recommendation_history([{'user': 'a', 'tag': 'Beach', 'count': 2}])
+    app.ingest_recommendation_history([{'user': 'b', 'tag': 'Beach'}], update_model=False)
+    ingested, _ = app.ingest_recommendation_history([{'user': 'a', 'tag': 'Temple'}])
+    # Replaying entries the model already holds changes nothing
+    with app.model_write_lock():
+        app._apply_history(app.history_store.load())
+        app._apply_history(ingested)
+
+    expected = app.RecommendationModel()
+    expected.train(app.history_store.load())
+    assert model_users(app) == ['a', 'b']
+    for user in ('a', 'b'):
+        weights = user_weights(app.recommendation_model, user)
+        assert weights == pytest.approx(user_weights(expected, user))
+
+
+def test_backfill_appends_only_missing_counts(app_state):
+    app = app_state
+    # One visit already arrived through the live ingest
+    app.ingest_recommendation_history([{'user': 'a', 'tag': 'Beach'}])
+    totals = [{'user': 'a', 'tag': 'Beach', 'count': 3}, {'user': 'b', 'tag': 'Temple', 'count': 2}]
+    ingested, updated = app.ingest_recommendation_history(totals, backfill=True)
+
+    assert updated
+    assert sorted(zip(ingested['user'], ingested['count'])) == [('a', 2.0), ('b', 2.0)]
+    assert model_users(app) == ['a', 'b']
+
+    # Running it again appends nothing
+    ingested, updated = app.ingest_recommendation_history(totals, backfill=True)
+    assert ingested.empty and updated
+    stored = app.history_store.load().groupby(['user', 'tag'])['count'].sum().to_dict()
+    assert stored == {('a', 'Beach'): 3.0, ('b', 'Temple'): 2.0}
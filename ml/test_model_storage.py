@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+
+
+def make_model(app, users):
+    model = app.RecommendationModel()
+    model.train(pd.DataFrame({'user': users, 'tag': ['Beach'] * len(users), 'count': 1}))
+    return model
+
+
+def array_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.npy'))
+
+
+def test_old_generation_cleanup_is_best_effort(app_state, tmp_path, monkeypatch):
+    app = app_state
+    path = str(tmp_path / 'model')
+    assert make_model(app, ['a']).save_model(path)
+    old_files = array_files(path)
+
+    remove = os.remove
+    def locked_remove(name):
+        raise PermissionError(13, 'File is in use', name)
+    monkeypatch.setattr(os, 'remove', locked_remove)
+    model = make_model(app, ['a', 'b'])
+    assert model.save_model(path)
+    assert set(old_files) < set(array_files(path))
+
+    loaded = app.RecommendationModel()
+    assert loaded.load_model(path)
+    assert loaded.generation == model.generation
+
+    # The next save removes what the previous one could not
+    monkeypatch.setattr(os, 'remove', remove)
+    newest = make_model(app, ['a', 'b', 'c'])
+    assert newest.save_model(path)
+    assert all(f".{newest.generation}." in name for name in array_files(path))
+
+
+def test_missing_model_loads_quietly(app_state, tmp_path, capsys):
+    model = app_state.RecommendationModel()
+    assert not model.load_model(str(tmp_path / 'missing'))
+    assert not model.load_model(str(tmp_path / 'missing.joblib'))
+    assert capsys.readouterr().out == ''
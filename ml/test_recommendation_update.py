@@ -0,0 +1,130 @@
+import random
+
+import pandas as pd
+import pytest
+
+import app
+from app import RecommendationModel
+
+START = pd.Timestamp('2024-01-01', tz='UTC')
+
+
+def make_history(n, users, tags, seed):
+    """Visits with fixed timestamps, so weights do not depend on when the test runs"""
+    rng = random.Random(seed)
+    return pd.DataFrame([{
+        'user': f"user_{rng.randrange(users)}",
+        'tag': f"tag_{rng.randrange(tags)}",
+        'count': rng.randint(1, 3),
+        'timestamp': (START + pd.Timedelta(hours=rng.randrange(24 * 300))).isoformat(),
+    } for _ in range(n)])
+
+
+def user_weights(model, user):
+    """Tag weights of a user at a fixed time, independent of the model's epoch"""
+    row = model.user_tag_matrix[model.get_user_row(user)]
+    return dict(zip(model.tags[row.indices].tolist(), row.data * model.decay_factor(START)))
+
+
+def neighbors(model, user):
+    """Neighbor scores of a user, keyed by neighbor name"""
+    row = model.get_user_row(user)
+    listed = model.neighbor_indices[row] >= 0
+    return dict(zip(model.users[model.neighbor_indices[row][listed]].tolist(),
+                    model.neighbor_scores[row][listed].tolist()))
+
+
+def assert_same_model(model, expected):
+    assert sorted(model.users.tolist()) == sorted(expected.users.tolist())
+    assert sorted(model.tags.tolist()) == sorted(expected.tags.tolist())
+    for user in expected.users.tolist():
+        assert user_weights(model, user) == pytest.approx(user_weights(expected, user))
+        got, want = neighbors(model, user), neighbors(expected, user)
+        assert sorted(got.values()) == pytest.approx(sorted(want.values()), abs=1e-5)
+        # Neighbors tied with the last listed one may be either of them
+        cutoff = min(want.values(), default=0) + 1e-5
+        assert {name: score for name, score in got.items() if score > cutoff} == \
+            pytest.approx({name: score for name, score in want.items() if score > cutoff}, abs=1e-5)
+
+
+def test_update_equals_train():
+    # Later batches bring new users and tags and repeat earlier visits
+    initial = make_history(400, users=40, tags=15, seed=0)
+    batches = [make_history(60, users=40 + 5 * seed, tags=15 + seed, seed=seed) for seed in range(1, 8)]
+    batches.append(initial.sample(30, random_state=0))
+
+    model = RecommendationModel(n_neighbors=5)
+    assert model.train(initial)
+    for batch in batches:
+        model = model.update(batch)
+        assert model is not None
+
+    expected = RecommendationModel(n_neighbors=5)
+    assert expected.train(pd.concat([initial] + batches, ignore_index=True))
+    assert_same_model(model, expected)
+
+
+def test_small_updates_equal_train():
+    # Few changed users, so most neighbor lists are merged rather than recomputed
+    initial = make_history(1500, users=200, tags=30, seed=10)
+    batches = [make_history(3, users=220, tags=32, seed=seed) for seed in range(11, 41)]
+
+    model = RecommendationModel(n_neighbors=5)
+    assert model.train(initial)
+    for batch in batches:
+        model = model.update(batch)
+        assert model is not None
+
+    expected = RecommendationModel(n_neighbors=5)
+    assert expected.train(pd.concat([initial] + batches, ignore_index=True))
+    assert_same_model(model, expected)
+
+
+def test_update_grows_capped_neighbor_lists():
+    # Three users can only hold two neighbors each until more users arrive
+    initial = make_history(20, users=3, tags=4, seed=1)
+    batch = make_history(50, users=12, tags=6, seed=2)
+    model = RecommendationModel(n_neighbors=5)
+    assert model.train(initial)
+    model = model.update(batch)
+
+    expected = RecommendationModel(n_neighbors=5)
+    assert expected.train(pd.concat([initial, batch], ignore_index=True))
+    assert model.neighbor_indices.shape == expected.neighbor_indices.shape
+    assert_same_model(model, expected)
+
+
+def test_update_leaves_the_published_model_untouched():
+    model = RecommendationModel(n_neighbors=5)
+    assert model.train(make_history(200, users=20, tags=8, seed=3))
+    before = {user: (user_weights(model, user), neighbors(model, user)) for user in model.users.tolist()}
+
+    updated = model.update(make_history(50, users=30, tags=10, seed=4))
+    assert updated is not model
+    assert {user: (user_weights(model, user), neighbors(model, user)) for user in model.users.tolist()} == before
+
+
+def test_stored_history_is_replayed_after_a_restart(app_state, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'recommendation_model', RecommendationModel(n_neighbors=5))
+    store = app.history_store
+    store.append(make_history(300, users=30, tags=10, seed=5).to_dict('records'))
+    assert app.retrain_recommendation_model(save_model=False)
+    path = str(tmp_path / 'model')
+    assert app.recommendation_model.save_model(path)
+
+    # Entries stored after the save, by this process or another one
+    store.append(make_history(80, users=40, tags=12, seed=6).to_dict('records'))
+    restarted = RecommendationModel()
+    assert restarted.load_model(path)
+    monkeypatch.setattr(app, 'recommendation_model', restarted)
+    assert app._apply_stored_history()
+
+    expected = RecommendationModel(n_neighbors=5)
+    assert expected.train(store.load())
+    assert app.recommendation_model.history_id == store.last_id()
+    assert_same_model(app.recommendation_model, expected)
+
+    # Nothing new in the store leaves the model as it is
+    current = app.recommendation_model
+    assert app._apply_stored_history()
+    assert app.recommendation_model is current
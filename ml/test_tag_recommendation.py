@@ -0,0 +1,51 @@
+import pickle
+import random
+
+import numpy as np
+
+from IndividualHistory import TagRecommendationModel
+
+TAGS = [f"tag_{i}" for i in range(12)]
+
+
+def make_visits(n, users, seed):
+    rng = random.Random(seed)
+    return [{"user": f"user_{rng.randrange(users)}", "tag": rng.choice(TAGS), "count": rng.randint(1, 3)}
+            for _ in range(n)]
+
+
+def assert_same_state(model, expected):
+    assert np.array_equal(model.cooccurrence_counts, expected.cooccurrence_counts)
+    assert model.tag_counts == expected.tag_counts
+    assert model.total_visits == expected.total_visits
+    assert np.allclose(model.cooccurrence_matrix, expected.cooccurrence_matrix)
+
+
+def test_update_equals_refit():
+    # Batches mix users seen in the fit, in earlier batches and new ones
+    initial = make_visits(500, users=50, seed=0)
+    batches = [make_visits(150, users=80, seed=seed) for seed in range(1, 12)]
+    model = TagRecommendationModel(set(TAGS)).fit(initial)
+    for batch in batches:
+        model.update(batch)
+
+    all_visits = initial + [visit for batch in batches for visit in batch]
+    assert_same_state(model, TagRecommendationModel(set(TAGS)).fit(all_visits))
+
+
+def test_update_of_empty_model_equals_fit():
+    visits = make_visits(300, users=10, seed=1)
+    model = TagRecommendationModel(set(TAGS))
+    for start in range(0, len(visits), 7):
+        model.update(visits[start:start + 7])
+
+    assert_same_state(model, TagRecommendationModel(set(TAGS)).fit(visits))
+
+
+def test_update_after_pickle_equals_refit():
+    initial = make_visits(400, users=30, seed=2)
+    batch = make_visits(100, users=40, seed=3)
+    model = pickle.loads(pickle.dumps(TagRecommendationModel(set(TAGS)).fit(initial)))
+    model.update(batch)
+
+    assert_same_state(model, TagRecommendationModel(set(TAGS)).fit(initial + batch))
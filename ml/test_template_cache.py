@@ -0,0 +1,38 @@
+from template_cache import TemplateCache, fingerprint, map_fields, apply_fields
+
+
+def test_amount_equal_to_account_digits_maps_to_amount_slot():
+    message = 'Rs 7854 debited from A/c X7854 on 12-Jan-24'
+    _, slots = fingerprint(message)
+    mapping = map_fields(message, slots, {'amount': 7854.0, 'account_number': 'X7854'})
+
+    _, new_slots = fingerprint('Rs 200 debited from A/c X1111 on 13-Jan-24')
+    assert apply_fields(mapping, new_slots) == {'amount': 200.0, 'account_number': 'X1111'}
+
+
+def test_ambiguous_number_is_not_cached():
+    message = 'Debited 7854 from A/c X7854'
+    _, slots = fingerprint(message)
+    assert [kind for kind, _, _, _ in slots] == ['NUM', 'NUM']
+    assert map_fields(message, slots, {'amount': 7854.0}) is None
+
+
+def test_hits_match_the_models_for_other_recipients(monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'micro_batch_window', 0)
+    monkeypatch.setattr(app, 'classification_cache', TemplateCache())
+    monkeypatch.setattr(app, 'extraction_cache', TemplateCache())
+    # Same skeleton, a person and a merchant as recipient
+    messages = [
+        'Payment of Rs 500 to Rahul Sharma done from A/c X1234 on 12-Jan-24 -HDFC',
+        'Payment of Rs 750 to Swiggy Ltd done from A/c X5678 on 13-Jan-24 -HDFC',
+        'Dear UPI user A/C X7854 debited by 60.0 on date 08Feb25 trf to Bobie Refno 503940628440. '
+        'If not u? call 1800111109. -SBI',
+        'Dear UPI user A/C X1111 debited by 99.5 on date 09Feb25 trf to Amazon Pay India Refno 503940628441. '
+        'If not u? call 1800111109. -SBI',
+    ]
+    assert fingerprint(messages[0])[0] == fingerprint(messages[1])[0]
+    assert fingerprint(messages[2])[0] == fingerprint(messages[3])[0]
+    for message in messages:
+        assert app.classify_message(message) == app.predict_upi_message(app.model, app.label_encoder, message)
+        assert app.extract_message_details(message) == app.message_extractor.predict_details(message)